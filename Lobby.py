@@ -1,16 +1,22 @@
 import tkinter as tk
-from tkinter import messagebox, Label, Button, Frame
-import pygame
+from tkinter import messagebox, Label, Button, Frame, Entry, Listbox
+import socket
 import threading
 import sys
 import os
-from game import Game
+from launcher import GameProcess
+import protocol
+
+# Nothing here imports pygame, numpy or the game: the window shows first,
+# and the game process is started right after to load them meanwhile
+POLL_MS = 100  # How often the lobby checks on the game process
+PREWARM_MS = 200  # Delay before the next game process is started
 
 class GhostChaseLobby:
     def __init__(self, root):
         self.root = root
         self.root.title("Ghost Chase Launcher")
-        self.root.geometry("500x400")
+        self.root.geometry("500x640")
         self.root.resizable(False, False)
         
         # Set background color
@@ -37,6 +43,42 @@ class GhostChaseLobby:
                                  command=self.start_game)
         self.start_button.pack(pady=10)
         
+        self.ai_button = Button(modes_frame, text="CONTRE L'IA", font=("Arial", 12, "bold"),
+                                bg="#444444", fg="#ffffff", width=15,
+                                command=self.start_ai_game)
+        self.ai_button.pack(pady=5)
+        
+        self.status_label = Label(modes_frame, text="", font=("Arial", 10), fg="#cccccc", bg="#2d2d2d")
+        self.status_label.pack()
+        self.game = None  # GameProcess running a game
+        self.warm = None  # GameProcess preloaded for the next one
+        
+        # Online rooms (server.py or match_host.py)
+        online_frame = Frame(root, bg="#2d2d2d")
+        online_frame.pack(pady=10, padx=20, fill="x")
+        
+        online_title = Label(online_frame, text="Parties en ligne:", 
+                             font=("Arial", 12, "bold"), fg="#ffffff", bg="#2d2d2d")
+        online_title.pack(anchor="w")
+        
+        self.server_entry = Entry(online_frame, font=("Arial", 10))
+        self.server_entry.insert(0, "127.0.0.1:5656")
+        self.server_entry.pack(fill="x", pady=5)
+        
+        self.rooms_list = Listbox(online_frame, height=6, font=("Courier", 10),
+                                  bg="#444444", fg="#ffffff", selectbackground="#ff9900")
+        self.rooms_list.pack(fill="x")
+        self.rooms = []
+        
+        online_buttons = Frame(online_frame, bg="#2d2d2d")
+        online_buttons.pack(pady=5)
+        
+        for text, command in (("Actualiser", self.refresh_rooms),
+                              ("Rejoindre", self.join_room),
+                              ("Nouvelle salle", self.new_room)):
+            Button(online_buttons, text=text, font=("Arial", 10), bg="#444444", fg="#ffffff",
+                   width=12, command=command).pack(side="left", padx=5)
+        
         # Instructions
         instructions_frame = Frame(root, bg="#2d2d2d")
         instructions_frame.pack(pady=10)
@@ -64,6 +106,12 @@ class GhostChaseLobby:
                            command=self.quit_game)
         quit_button.pack(side="right", padx=20)
         
+        self.root.after(PREWARM_MS, self.prewarm)
+        
+    def prewarm(self):
+        if self.warm is None and self.game is None:
+            self.warm = GameProcess()
+        
     def start_game(self):
         # Disable the start button to prevent multiple clicks
         self.start_button.config(state="disabled")
@@ -75,23 +123,110 @@ class GhostChaseLobby:
                            "Fantôme: WASD pour se déplacer\n\n"
                            "Appuyez sur OK pour commencer")
         
-        # Start the game in a separate thread
-        game_thread = threading.Thread(target=self.run_game)
-        game_thread.daemon = True  # Thread will close when main program exits
-        game_thread.start()
+        self.launch()
+        
+    def start_ai_game(self):
+        # The hunter alone, against the AI ghost
+        self.launch(ai_ghost=True)
         
-    def run_game(self):
+    def launch(self, host=None, port=None, room_id=None, ai_ghost=False):
+        # The game runs in its own process: pygame gets a main thread of its
+        # own, a crash cannot take the lobby down, and results come back
+        # through a pipe polled from the Tk loop
+        if self.game is not None:
+            messagebox.showinfo("Ghost Chase", "Une partie est déjà en cours")
+            return
+        self.start_button.config(state="disabled")
+        self.ai_button.config(state="disabled")
+        self.status_label.config(text="Lancement...")
+        self.game = self.warm or GameProcess()
+        self.warm = None
+        self.game.start(host, port, room_id, ai_ghost)
+        self.root.after(POLL_MS, self.poll_game)
+        
+    def poll_game(self):
+        game = self.game
+        # Checked before reading so nothing sent before the exit is missed
+        running = game.running()
+        for message in game.messages():
+            if message[0] == "ready":
+                self.status_label.config(text="Partie en cours...")
+            elif message[0] == "result":
+                winner = message[1] or "personne"
+                self.status_label.config(text=f"Partie en cours... (dernière victoire : {winner})")
+            elif message[0] == "error":
+                print(message[2], file=sys.stderr)
+                messagebox.showerror("Error", f"Une erreur est survenue: {message[1]}")
+        
+        if running:
+            self.root.after(POLL_MS, self.poll_game)
+            return
+        
+        if game.crashed():
+            messagebox.showerror("Error", f"Le jeu s'est arrêté de façon inattendue (code {game.exitcode})")
+        game.close()
+        self.game = None
+        self.status_label.config(text="")
+        self.start_button.config(state="normal")
+        self.ai_button.config(state="normal")
+        self.root.after(PREWARM_MS, self.prewarm)
+        
+    def server_address(self):
+        host, _, port = self.server_entry.get().strip().rpartition(":")
+        return host or "127.0.0.1", int(port)
+        
+    def refresh_rooms(self):
+        try:
+            host, port = self.server_address()
+        except ValueError:
+            messagebox.showerror("Error", "Adresse invalide, format attendu: hôte:port")
+            return
+        
+        # Fetch in a thread so a silent server does not freeze the window
+        def fetch():
+            from client import fetch_rooms  # Loads numpy, only once asked
+            try:
+                rooms = fetch_rooms(host, port)
+            except (OSError, socket.timeout):
+                rooms = None
+            self.root.after(0, lambda: self.show_rooms(host, rooms))
+        
+        threading.Thread(target=fetch, daemon=True).start()
+        
+    def show_rooms(self, host, rooms):
+        self.rooms_list.delete(0, "end")
+        if rooms is None:
+            self.rooms = []
+            self.rooms_list.insert("end", "Aucune réponse du serveur")
+            return
+        self.rooms = [(host, room) for room in rooms]
+        for room_id, port, players, finished in rooms:
+            seats = {0: "vide", 1: "attend un fantôme", 2: "attend un chasseur", 3: "complète"}[players]
+            state = "terminée" if finished else "en cours"
+            self.rooms_list.insert("end", f"Salle {room_id:<6} {seats:<20} {state}")
+        if not rooms:
+            self.rooms_list.insert("end", "Aucune salle, créez-en une")
+        
+    def join_room(self):
+        selection = self.rooms_list.curselection()
+        if not selection or selection[0] >= len(self.rooms):
+            messagebox.showinfo("Ghost Chase", "Choisissez une salle dans la liste")
+            return
+        host, (room_id, port, players, finished) = self.rooms[selection[0]]
+        self.launch(host, port, room_id)
+        
+    def new_room(self):
         try:
-            game = Game()
-            game.run()
-        except Exception as e:
-            messagebox.showerror("Error", f"Une erreur est survenue: {str(e)}")
-        finally:
-            # Re-enable the start button when the game ends
-            self.root.after(0, lambda: self.start_button.config(state="normal"))
-    
+            host, port = self.server_address()
+        except ValueError:
+            messagebox.showerror("Error", "Adresse invalide, format attendu: hôte:port")
+            return
+        self.launch(host, port, protocol.NEW_ROOM)
+        
     def quit_game(self):
         if messagebox.askyesno("Quitter", "Voulez-vous vraiment quitter?"):
+            if self.warm:
+                self.warm.close()
             self.root.destroy()
             sys.exit()
 
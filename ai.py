@@ -0,0 +1,357 @@
+# ai.py
+import math
+from array import array
+from collections import OrderedDict
+from simulation import LIGHT_RADIUS, LAMP_COOLDOWN, PLAYER_SIZE
+
+UNREACHED = 0xFFFF
+# 8-connected moves; the first four are the straight ones
+MOVES = ((1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1))
+# Move keys by octant of atan2(dy, dx), screen y pointing down
+OCTANTS = ((1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1))
+REPLAN_TICKS = 12  # A bot re-chooses its goal ten times per second
+FLOW_FIELDS = 512  # Distance fields kept per level (10 kB each on an 80x60 grid)
+SEARCH_CELLS = 600  # Cells a server expands per tick for pending fields (under 1 ms)
+GOAL_STEP = 2  # Moving targets are tracked on a grid this many cells apart
+MAX_SEARCHES = 32  # Pending field searches; the oldest request is dropped past it
+LOW_BATTERY = 30  # A hunter bot goes for a pickup under this charge
+KEEP_AWAY = 30  # Hunter bots back off from a ghost closer than this (px)
+
+
+class NavGrid:
+    # Walkable cells of a level, from level.occupancy (a body fits at the
+    # cell origin), with their 8-connected walkable neighbours. Diagonals
+    # need both straight neighbours free, so a path never cuts a corner.
+    def __init__(self, level):
+        self.cell_size = level.cell_size
+        self.cols = level.cols
+        self.rows = level.rows
+        self.size = self.cols * self.rows
+        self.walkable = bytearray(level.occupancy.astype(bool).ravel().tobytes())
+        self.neighbours = [()] * self.size
+        self.link(range(self.size))
+
+    def link(self, cells):
+        cols, rows, walkable = self.cols, self.rows, self.walkable
+        for cell in cells:
+            row, col = divmod(cell, cols)
+            linked = []
+            for dc, dr in MOVES:
+                c, r = col + dc, row + dr
+                if not (0 <= c < cols and 0 <= r < rows and walkable[r * cols + c]):
+                    continue
+                if dc and dr and not (walkable[row * cols + c] and walkable[r * cols + col]):
+                    continue
+                linked.append(r * cols + c)
+            self.neighbours[cell] = tuple(linked)
+
+    def around(self, cell):
+        # The cell and its 8 neighbours, walkable or not
+        row, col = divmod(cell, self.cols)
+        return [r * self.cols + c
+                for r in range(max(0, row - 1), min(self.rows, row + 2))
+                for c in range(max(0, col - 1), min(self.cols, col + 2))]
+
+    def set_walkable(self, cells, walkable=True):
+        # Open or close cells (doors...); returns the cells that changed,
+        # for FlowFields.invalidate
+        changed = [cell for cell in cells if self.walkable[cell] != walkable]
+        for cell in changed:
+            self.walkable[cell] = walkable
+        self.link({other for cell in changed for other in self.around(cell)})
+        return changed
+
+    def cell_at(self, x, y):
+        col = min(self.cols - 1, max(0, int(x // self.cell_size)))
+        row = min(self.rows - 1, max(0, int(y // self.cell_size)))
+        return row * self.cols + col
+
+    def goal_at(self, x, y):
+        # Cell of a moving target, snapped to every GOAL_STEP cells when
+        # walkable: a target moving inside the step keeps the same field
+        cell = self.cell_at(x, y)
+        row, col = divmod(cell, self.cols)
+        snapped = (row - row % GOAL_STEP) * self.cols + col - col % GOAL_STEP
+        return snapped if self.walkable[snapped] else cell
+
+    def origin(self, cell):
+        row, col = divmod(cell, self.cols)
+        return col * self.cell_size, row * self.cell_size
+
+    def distances(self, target):
+        # Breadth-first distance (in moves) of every cell to `target`
+        search = FieldSearch(self, target)
+        search.advance(self.size)
+        return search.dist
+
+
+class FieldSearch:
+    # Breadth-first search from a target cell, expanded a given number of
+    # cells at a time so it can be spread over several ticks
+    __slots__ = ('neighbours', 'dist', 'frontier', 'reached', 'index', 'depth')
+
+    def __init__(self, nav, target):
+        self.neighbours = nav.neighbours
+        self.dist = array('H', [UNREACHED]) * nav.size
+        self.dist[target] = 0
+        self.frontier = [target]
+        self.reached = []
+        self.index = 0
+        self.depth = 1
+
+    def advance(self, cells):
+        # Expand up to `cells` cells, returns the cells left unused
+        dist, neighbours = self.dist, self.neighbours
+        frontier, reached, index, depth = self.frontier, self.reached, self.index, self.depth
+        while cells > 0:
+            if index == len(frontier):
+                if not reached:
+                    break
+                frontier, reached, index = reached, [], 0
+                depth += 1
+            cell = frontier[index]
+            index += 1
+            cells -= 1
+            for other in neighbours[cell]:
+                if dist[other] == UNREACHED:
+                    dist[other] = depth
+                    reached.append(other)
+        self.frontier, self.reached, self.index, self.depth = frontier, reached, index, depth
+        return cells
+
+    def done(self):
+        # Every reachable cell has its distance
+        return self.index == len(self.frontier) and not self.reached
+
+
+class FlowFields:
+    # Distance fields toward target cells, computed on demand and kept in
+    # an LRU. A field is shared by every bot heading to (or away from) the
+    # same cell, so a bot tick is a few array lookups. After
+    # NavGrid.set_walkable, invalidate() only drops the fields that reached
+    # the changed area; the others are still exact.
+    # Searches are computed at once by default. A server calls
+    # start_tick(cells) every tick instead: a missing field is then queued,
+    # get() returns None until it is done, and the queued searches share a
+    # fixed number of cells per tick, so a burst of new targets never makes
+    # a tick late (bots keep their previous field meanwhile).
+    def __init__(self, nav, max_fields=FLOW_FIELDS):
+        self.nav = nav
+        self.max_fields = max_fields
+        self.fields = OrderedDict()
+        self.searches = OrderedDict()  # Target -> FieldSearch, when spread over ticks
+        self.spread = False
+        self.computed = 0  # Fields computed, for the benchmarks
+
+    def start_tick(self, cells=SEARCH_CELLS):
+        self.spread = True
+        while cells > 0 and self.searches:
+            target, search = next(iter(self.searches.items()))
+            cells = search.advance(cells)
+            if search.done():
+                del self.searches[target]
+                self.store(target, search.dist)
+
+    def store(self, target, field):
+        self.fields[target] = field
+        self.computed += 1
+        if len(self.fields) > self.max_fields:
+            self.fields.popitem(last=False)
+
+    def get(self, target):
+        field = self.fields.get(target)
+        if field is not None:
+            self.fields.move_to_end(target)
+        elif not self.spread:
+            field = self.nav.distances(target)
+            self.store(target, field)
+        elif target not in self.searches:
+            self.searches[target] = FieldSearch(self.nav, target)
+            if len(self.searches) > MAX_SEARCHES:
+                self.searches.popitem(last=False)
+        return field
+
+    def invalidate(self, cells):
+        self.searches.clear()  # Started on the old grid
+        area = {other for cell in cells for other in self.nav.around(cell)}
+        for target, field in list(self.fields.items()):
+            if any(field[cell] != UNREACHED for cell in area):
+                del self.fields[target]
+
+    def downhill(self, field, cell):
+        # Neighbour closest to the field's target, None at the target
+        best, best_distance = None, field[cell]
+        for other in self.nav.neighbours[cell]:
+            if field[other] < best_distance:
+                best, best_distance = other, field[other]
+        return best
+
+    def uphill(self, field, cell):
+        # Neighbour farthest from the field's target (fleeing)
+        best, best_distance = None, field[cell]
+        for other in self.nav.neighbours[cell]:
+            if best_distance < field[other] != UNREACHED:
+                best, best_distance = other, field[other]
+        return best
+
+
+def flow_fields_for(level):
+    # One navigation grid and field cache per level, kept on the Level so
+    # every bot and every room sharing it shares them too. Not keyed on the
+    # name: two level files may well use the same one.
+    if level.flow_fields is None:
+        level.flow_fields = FlowFields(NavGrid(level))
+    return level.flow_fields
+
+
+def sign(value, deadband=0.5):
+    return (value > deadband) - (value < -deadband)
+
+
+def alive_players(sim, kind):
+    return [player for player in sim.players.values() if player.type == kind and player.alive]
+
+
+def nearest(player, others):
+    return min(others, key=lambda other: (other.x - player.x) ** 2 + (other.y - player.y) ** 2,
+               default=None)
+
+
+class Bot:
+    # Drives one player of a Simulation: decide(sim) returns its input for
+    # the next tick as (dx, dy, toggle_lamp). The goal is re-chosen every
+    # REPLAN_TICKS; the ticks in between only follow the current field.
+    # Bots of one process are given different phases so they do not all
+    # replan on the same tick, and a bot whose field is still being searched
+    # (FlowFields.start_tick) plans again on the next tick.
+    def __init__(self, flow, player, replan_ticks=REPLAN_TICKS, phase=0):
+        self.flow = flow
+        self.nav = flow.nav
+        self.player = player
+        self.replan_ticks = replan_ticks
+        self.ticks = phase
+        self.field = None  # Distance field followed
+        self.flee = False  # Go up the field instead of down
+        self.replan = True  # Plan on the next tick
+        self.last_move = (0, 0)
+        self.stuck = 0
+        self.lamp_wanted = False
+
+    def decide(self, sim):
+        if self.replan or self.ticks % self.replan_ticks == 0:
+            self.replan = False
+            self.plan(sim)
+        self.ticks += 1
+        dx, dy = self.move()
+        return dx, dy, self.toggle_lamp(sim)
+
+    def plan(self, sim):
+        pass
+
+    def toggle_lamp(self, sim):
+        return False
+
+    def follow(self, target_cell, flee=False):
+        field = self.flow.get(target_cell)
+        if field is None:
+            self.replan = True  # Keep the current field meanwhile
+        else:
+            self.field = field
+            self.flee = flee
+
+    def cell(self):
+        # Nearest cell origin, not the cell under the body's corner: a bot
+        # within the deadband of its next cell has reached it
+        half = self.nav.cell_size / 2
+        return self.nav.cell_at(self.player.x + half, self.player.y + half)
+
+    def move(self):
+        player = self.player
+        cell = self.cell()
+        if self.field is None:
+            return 0, 0
+        next_cell = (self.flow.uphill if self.flee else self.flow.downhill)(self.field, cell)
+        if next_cell is None:
+            return 0, 0
+
+        # Head for the origin of the next cell, where the body is known to
+        # fit. Blocked last tick means the body is a fraction of a pixel off
+        # the grid against a wall edge: then aim at the exact origin, one
+        # axis at a time.
+        if (player.x, player.y) == (player.prev_x, player.prev_y) and self.last_move != (0, 0):
+            self.stuck += 1
+        else:
+            self.stuck = 0
+        x, y = self.nav.origin(next_cell)
+        deadband = 0 if self.stuck else 0.5
+        dx, dy = sign(x - player.x, deadband), sign(y - player.y, deadband)
+        if self.stuck and dx and dy:
+            dx, dy = (dx, 0) if self.stuck % 2 else (0, dy)
+        self.last_move = (dx, dy)
+        return dx, dy
+
+
+class GhostBot(Bot):
+    # Hunts the nearest hunter, and runs from it while in its light or
+    # close to a lit lamp
+    def plan(self, sim):
+        ghost = self.player
+        hunter = nearest(ghost, alive_players(sim, 'chasseur'))
+        if hunter is None:
+            self.field = None
+            return
+        distance = math.hypot(hunter.x - ghost.x, hunter.y - ghost.y)
+        threatened = ghost.lit or (hunter.lampe_on and distance < LIGHT_RADIUS)
+        self.follow(self.nav.goal_at(hunter.x, hunter.y), flee=threatened)
+
+
+class HunterBot(Bot):
+    # Walks to the nearest ghost and, once it is in sight and in range, heads
+    # straight at it: the lamp points where the hunter walks, so that keeps
+    # the ghost in the light. When running low it fetches a battery pickup,
+    # or keeps away from the ghost until one appears.
+    def __init__(self, flow, player, replan_ticks=REPLAN_TICKS, phase=0):
+        super().__init__(flow, player, replan_ticks, phase)
+        self.target = None  # Ghost aimed at directly
+
+    def plan(self, sim):
+        hunter = self.player
+        self.target = None
+        self.lamp_wanted = False
+        low = hunter.batterie_lampe < LOW_BATTERY
+        battery = nearest(hunter, sim.batteries) if low else None
+        if battery is not None:
+            self.follow(self.nav.cell_at(battery.x, battery.y))
+            if self.field is not None and self.field[self.cell()] != UNREACHED:
+                return
+
+        ghost = nearest(hunter, alive_players(sim, 'fantome'))
+        if ghost is None:
+            self.field = None
+            return
+        self.follow(self.nav.goal_at(ghost.x, ghost.y), flee=low)
+        if low and (self.field is None or self.flow.uphill(self.field, self.cell()) is not None):
+            return
+        # In range, or cornered while fleeing: fight with what is left
+        half = PLAYER_SIZE / 2
+        if (math.hypot(ghost.x - hunter.x, ghost.y - hunter.y) < LIGHT_RADIUS
+                and sim.line_of_sight(hunter.x + half, hunter.y + half, ghost.x + half, ghost.y + half)):
+            self.target = ghost
+            self.lamp_wanted = hunter.batterie_lampe > 0
+
+    def move(self):
+        hunter, ghost = self.player, self.target
+        blocked = (hunter.x, hunter.y) == (hunter.prev_x, hunter.prev_y) and self.last_move != (0, 0)
+        if ghost is None or not ghost.alive or blocked:
+            return super().move()
+        dx, dy = ghost.x - hunter.x, ghost.y - hunter.y
+        move = OCTANTS[round(math.atan2(dy, dx) / (math.pi / 4)) % 8]
+        if dx * dx + dy * dy < KEEP_AWAY * KEEP_AWAY:
+            move = (-move[0], -move[1])
+        self.last_move = move
+        return move
+
+    def toggle_lamp(self, sim):
+        if sim.time - self.player.derniere_utilisation_lampe <= LAMP_COOLDOWN:
+            return False
+        return self.player.lampe_on != self.lamp_wanted
@@ -0,0 +1,191 @@
+# assets.py
+import os
+import struct
+import pygame
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SEARCH_DIRS = ("", "assets")  # Looked up in this order, relative to the root
+CACHE_DIR = ".assetcache"  # Decoded pixels, relative to the root
+ATLAS_WIDTH = 256  # Width of a sprite atlas; rows are added as needed
+
+# Images of the game: candidate file names, and the plain rectangle drawn
+# instead when none of them exists
+SPRITES = {
+    "ghost": (("fantome.png",), (20, 20), (200, 200, 255)),
+    "hunter": (("chasseur.png",), (20, 20), (255, 200, 100)),
+    "background": (("sol.jpg", "background.jpg"), (800, 600), (50, 50, 50)),
+}
+
+# Decoded image cache (.surf), little endian:
+#   header (CACHE_HEADER)  magic, version, width, height, has alpha,
+#                          source mtime (ns), source size
+#   pixels                 RGBA if it has alpha, else RGB, row by row
+CACHE_MAGIC = b"GCAS"
+CACHE_VERSION = 1
+CACHE_HEADER = struct.Struct("<4sHHHBqq")
+
+
+class Sprite:
+    # Area of an atlas surface holding one image: screen.blit(sprite.surface,
+    # position, sprite.area)
+    __slots__ = ('surface', 'area')
+
+    def __init__(self, surface, area):
+        self.surface = surface
+        self.area = area
+
+
+def has_alpha(surface):
+    # True if the image has per-pixel alpha that is not fully opaque
+    if not surface.get_flags() & pygame.SRCALPHA:
+        return False
+    return int(pygame.surfarray.pixels_alpha(surface).min()) < 255
+
+
+def pack(sizes, width=ATLAS_WIDTH):
+    # Shelf packing, tallest first: {name: (w, h)} -> ({name: (x, y)}, atlas size)
+    positions = {}
+    x = y = shelf = 0
+    atlas_width = 0
+    for name, (w, h) in sorted(sizes.items(), key=lambda item: -item[1][1]):
+        if x + w > width and x > 0:
+            x, y, shelf = 0, y + shelf, 0
+        positions[name] = (x, y)
+        x += w
+        shelf = max(shelf, h)
+        atlas_width = max(atlas_width, x)
+    return positions, (max(1, atlas_width), max(1, y + shelf))
+
+
+class AssetManager:
+    # Finds, decodes and converts the images once per process. Sources are
+    # resolved with one directory listing per search directory, decoded
+    # pixels are kept in a disk cache that is rebuilt when a source changes,
+    # and images are converted to the display format, sprites packed into
+    # one opaque atlas and one with per-pixel alpha.
+    def __init__(self, root=BASE_DIR, specs=SPRITES, cache=True):
+        self.root = root
+        self.specs = specs
+        self.cache_dir = os.path.join(root, CACHE_DIR) if cache else None
+        self.paths = None  # Name -> source path, or None for the fallback
+        self.decoded = {}  # Name -> (surface, has alpha), any pixel format
+        self.converted = {}  # (display format, names) -> converted surfaces or sprites
+
+    def resolve(self):
+        if self.paths is None:
+            listings = {}
+            for directory in SEARCH_DIRS:
+                try:
+                    listings[directory] = set(os.listdir(os.path.join(self.root, directory)))
+                except OSError:
+                    listings[directory] = set()
+            self.paths = {}
+            for name, (candidates, _, _) in self.specs.items():
+                self.paths[name] = next((os.path.join(self.root, directory, filename)
+                                         for filename in candidates
+                                         for directory in SEARCH_DIRS
+                                         if filename in listings[directory]), None)
+        return self.paths
+
+    def cache_path(self, name):
+        return os.path.join(self.cache_dir, f"{name}.surf")
+
+    def read_cache(self, name, stat):
+        try:
+            with open(self.cache_path(name), "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        if len(data) < CACHE_HEADER.size:
+            return None
+        magic, version, width, height, alpha, mtime, size = CACHE_HEADER.unpack_from(data)
+        if (magic, version, mtime, size) != (CACHE_MAGIC, CACHE_VERSION, stat.st_mtime_ns, stat.st_size):
+            return None
+        pixels = data[CACHE_HEADER.size:]
+        if len(pixels) != width * height * (4 if alpha else 3):
+            return None
+        return pygame.image.frombuffer(pixels, (width, height), "RGBA" if alpha else "RGB"), bool(alpha)
+
+    def write_cache(self, name, stat, surface, alpha):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            header = CACHE_HEADER.pack(CACHE_MAGIC, CACHE_VERSION, surface.get_width(), surface.get_height(),
+                                       alpha, stat.st_mtime_ns, stat.st_size)
+            pixels = pygame.image.tostring(surface, "RGBA" if alpha else "RGB")
+            temporary = self.cache_path(name) + ".tmp"
+            with open(temporary, "wb") as f:
+                f.write(header)
+                f.write(pixels)
+            os.replace(temporary, self.cache_path(name))
+        except (OSError, pygame.error):
+            pass  # Read-only install: decode every time
+
+    def decode(self, path):
+        surface = pygame.image.load(path)
+        return surface, has_alpha(surface)
+
+    def image(self, name):
+        # Decoded image and whether it has alpha, in its own pixel format
+        if name not in self.decoded:
+            path = self.resolve()[name]
+            image = None
+            if path is not None:
+                try:
+                    stat = os.stat(path)
+                    if self.cache_dir:
+                        image = self.read_cache(name, stat)
+                    if image is None:
+                        image = self.decode(path)
+                        if self.cache_dir:
+                            self.write_cache(name, stat, *image)
+                except (OSError, pygame.error) as e:
+                    print(f"Error loading image {path}: {e}")
+            if image is None:
+                _, size, color = self.specs[name]
+                surface = pygame.Surface(size)
+                surface.fill(color)
+                image = surface, False
+            self.decoded[name] = image
+        return self.decoded[name]
+
+    def display_format(self):
+        screen = pygame.display.get_surface()
+        return screen.get_bitsize(), screen.get_masks()
+
+    def surface(self, name):
+        # Single image converted to the display format (needs set_mode)
+        key = (self.display_format(), name)
+        if key not in self.converted:
+            surface, alpha = self.image(name)
+            self.converted[key] = surface.convert_alpha() if alpha else surface.convert()
+        return self.converted[key]
+
+    def sprites(self, names):
+        # {name: Sprite} for the given images, packed into atlases in the
+        # display format (needs set_mode)
+        key = (self.display_format(), tuple(names))
+        if key not in self.converted:
+            decoded = {name: self.image(name) for name in names}
+            sprites = {}
+            for alpha in (False, True):
+                images = {name: surface for name, (surface, image_alpha) in decoded.items()
+                          if image_alpha == alpha}
+                if not images:
+                    continue
+                positions, size = pack({name: image.get_size() for name, image in images.items()})
+                if alpha:
+                    atlas = pygame.Surface(size, pygame.SRCALPHA).convert_alpha()
+                    atlas.fill((0, 0, 0, 0))
+                else:
+                    atlas = pygame.Surface(size).convert()
+                for name, image in images.items():
+                    # Adding onto transparent black copies the alpha instead of blending
+                    area = atlas.blit(image, positions[name],
+                                      special_flags=pygame.BLEND_RGBA_ADD if alpha else 0)
+                    sprites[name] = Sprite(atlas, area)
+            self.converted[key] = sprites
+        return self.converted[key]
+
+
+# Shared by every Game of the process
+ASSETS = AssetManager()
@@ -0,0 +1,527 @@
+# bench.py
+import argparse
+import functools
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from array import array
+
+# Run without a window, keep stdout clean for --json -
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import numpy as np
+import pygame
+from game import Game
+from assets import AssetManager
+from level import Level, walkable_grid
+from entities import BatteryRecharge
+from ai import FlowFields, NavGrid, GhostBot, HunterBot
+from replay import Recorder, Replay, ReplayRunner
+from visibility import VisibilityMap
+from simulation import Simulation, Inputs, PLAYER_SIZE, TICK_RATE
+from profiler import FrameProfiler
+
+DIRECTIONS = (-1, 0, 1)
+
+
+def percentile(samples, p):
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, int(round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(times):
+    # Stats of a list of durations in ms
+    mean = sum(times) / len(times)
+    return {
+        "mean_ms": mean,
+        "p50_ms": percentile(times, 50),
+        "p99_ms": percentile(times, 99),
+        "per_sec": 1000 / mean if mean else float("inf"),
+    }
+
+
+def scripted_inputs(ticks, seed=0, hold=30):
+    # Deterministic input script: each player keeps a random direction for
+    # `hold` ticks
+    rng = random.Random(seed)
+    script = []
+    for tick in range(ticks):
+        if tick % hold == 0:
+            hunter = (rng.choice(DIRECTIONS), rng.choice(DIRECTIONS))
+            ghost = (rng.choice(DIRECTIONS), rng.choice(DIRECTIONS))
+        script.append(Inputs(*hunter, *ghost))
+    return script
+
+
+def new_match(level=None, seed=0, hunters=1, ghosts=1):
+    # Benchmark match that lasts: ghosts survive the light and lamps never
+    # run out (a catch still ends a 1v1, callers start a new one)
+    sim = Simulation(level, seed=seed, hunters=hunters, ghosts=ghosts)
+    for ghost in sim.ghosts:
+        ghost.points_de_vie = float("inf")
+    for hunter in sim.hunters:
+        hunter.drain_rate = 0
+    return sim
+
+
+def random_level(wall_count, seed=0, wall_size=20, density=1 / 4000):
+    # Square map with about one wall per 4000 px², borders included
+    rng = random.Random(seed)
+    side = max(400, int((wall_count / density) ** 0.5)) // 10 * 10
+    walls = [(0, 0, side, wall_size), (0, 0, wall_size, side),
+             (side - wall_size, 0, wall_size, side), (0, side - wall_size, side, wall_size)]
+    while len(walls) < wall_count:
+        width, height = rng.choice([(wall_size, rng.randrange(40, 200, 10)),
+                                    (rng.randrange(40, 200, 10), wall_size)])
+        walls.append((rng.randrange(0, side - width, 10), rng.randrange(0, side - height, 10),
+                      width, height))
+    walls = np.array(walls, dtype=np.int32)
+
+    occupancy = walkable_grid(walls.tolist(), side, side, 10)
+    free_cells = np.flatnonzero(occupancy).astype(np.int32)
+    cols = occupancy.shape[1]
+    spawns = [((cell % cols) * 10, (cell // cols) * 10) for cell in free_cells[:2].tolist()]
+    return Level(f"random-{wall_count}", side, side, 10, walls, occupancy,
+                 np.array(spawns[:1], dtype=np.int32), np.array(spawns[1:], dtype=np.int32),
+                 free_cells)
+
+
+def bench_simulation(ticks=20000, seed=0):
+    # Headless simulation ticks per second, lamp on
+    sim = new_match(seed=seed)
+    sim.chasseur.lampe_on = True
+    times = []
+    for inputs in scripted_inputs(ticks, seed):
+        if sim.game_over:
+            sim = new_match(seed=seed)
+            sim.chasseur.lampe_on = True
+        start = time.perf_counter()
+        sim.step(inputs)
+        times.append((time.perf_counter() - start) * 1000)
+    results = summarize(times)
+    results["profiled_tick_ms"] = profiled_ticks(seed=seed)
+    return results
+
+
+def profiled_ticks(ticks=1000, seed=0):
+    # Same ticks under a FrameProfiler, as with GHOSTCHASE_PROFILE=1
+    sim = new_match(seed=seed)
+    sim.chasseur.lampe_on = True
+    sim.profiler = profiler = FrameProfiler()
+    for inputs in scripted_inputs(ticks, seed):
+        profiler.begin_frame()
+        sim.step(inputs)
+        profiler.end_frame()
+    return profiler.summary()["frame"]["mean"]
+
+
+def bench_render(frames=1000, seed=0):
+    # Game.draw frame time with the lamp off and on, two ticks per frame
+    game = Game()
+    results = {}
+    for lamp_on in (False, True):
+        script = scripted_inputs(frames * 2, seed)
+        times = []
+        for frame in range(frames):
+            if frame == 0 or game.sim.game_over:
+                game.sim = new_match(seed=seed)
+                game.sim.chasseur.lampe_on = lamp_on
+                game.dirty.invalidate()
+            game.sim.step(script[2 * frame])
+            game.sim.step(script[2 * frame + 1])
+            start = time.perf_counter()
+            game.draw(0.5)
+            times.append((time.perf_counter() - start) * 1000)
+        results["lamp_on" if lamp_on else "lamp_off"] = summarize(times)
+
+    # Light cone alone
+    hunter = game.sim.chasseur
+    start = time.perf_counter()
+    for _ in range(frames):
+        game.draw_light_cone(game.screen, hunter.x, hunter.y)
+    results["light_cone"] = summarize([(time.perf_counter() - start) * 1000 / frames])
+    pygame.quit()
+    return results
+
+
+def bench_allocations(frames=300, seed=0):
+    # Python allocations of a tick plus a frame, measured with tracemalloc
+    # (which slows things down, hence a separate run)
+    game = Game()
+    game.sim = new_match(seed=seed)
+    game.sim.chasseur.lampe_on = True
+    script = scripted_inputs(frames, seed)
+    for inputs in script[:10]:
+        game.sim.step(inputs)
+        game.draw()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for inputs in script:
+        game.sim.step(inputs)
+        game.draw()
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    pygame.quit()
+
+    retained = sum(stat.count_diff for stat in after.compare_to(before, "filename") if stat.count_diff > 0)
+    return {
+        "frames": frames,
+        "peak_kib": peak / 1024,
+        "retained_blocks": retained,
+        "retained_blocks_per_frame": retained / frames,
+    }
+
+
+def bench_restarts(rounds=300, ticks=20, seed=0):
+    # Cost of R on the game over screen, and Python memory over a long
+    # session (traced, so the times are only comparable with each other)
+    start = time.perf_counter()
+    game = Game()
+    init_ms = (time.perf_counter() - start) * 1000
+    script = scripted_inputs(ticks, seed)
+
+    # Preallocated so the measurement itself does not show up as growth
+    times = array('d', [0.0]) * rounds
+    memory = array('d', [0.0]) * rounds
+    tracemalloc.start()
+    for round_index in range(rounds):
+        start = time.perf_counter()
+        game.restart()
+        times[round_index] = (time.perf_counter() - start) * 1000
+        for inputs in script:
+            game.sim.step(inputs)
+        game.draw()
+        game.sim.game_over = True
+        game.sim.winner = "Chasseur"
+        game.draw()
+        memory[round_index] = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    pygame.quit()
+
+    tenth = max(1, rounds // 10)
+    return {
+        "game_init_ms": init_ms,
+        "restart_ms": sum(times) / len(times),
+        "rounds": rounds,
+        "memory_first_kib": sum(memory[:tenth]) / tenth / 1024,
+        "memory_last_kib": sum(memory[-tenth:]) / tenth / 1024,
+    }
+
+
+def bench_assets(blits=20000, seed=0):
+    # Image loading (decode vs disk cache), Game construction, and blit cost
+    # of an image straight from pygame.image.load vs converted in the atlas.
+    # The repository ships no images, so random ones are generated.
+    game = Game()
+    root = tempfile.mkdtemp(prefix="ghostchase-assets-")
+    try:
+        rng = np.random.default_rng(seed)
+        ghost = pygame.Surface((20, 20), pygame.SRCALPHA)
+        ghost.fill((0, 0, 0, 0))
+        pygame.draw.circle(ghost, (200, 200, 255, 200), (10, 10), 9)
+        pygame.image.save(ghost, os.path.join(root, "fantome.png"))
+        background = pygame.Surface((800, 600))
+        pygame.surfarray.blit_array(background, rng.integers(0, 255, (800, 600, 3)))
+        pygame.image.save(background, os.path.join(root, "sol.jpg"))
+
+        results = {}
+        for name in ("decode", "disk_cache"):
+            start = time.perf_counter()
+            assets = AssetManager(root)
+            assets.sprites(("hunter", "ghost"))
+            assets.surface("background")
+            results[f"load_{name}_ms"] = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        Game()
+        results["game_init_ms"] = (time.perf_counter() - start) * 1000
+
+        screen = game.screen
+        sprite = assets.sprites(("hunter", "ghost"))["ghost"]
+        loaded = pygame.image.load(os.path.join(root, "fantome.png"))
+        for name, blit in (("sprite_loaded", lambda: screen.blit(loaded, (100, 100))),
+                           ("sprite_atlas", lambda: screen.blit(sprite.surface, (100, 100), sprite.area))):
+            start = time.perf_counter()
+            for _ in range(blits):
+                blit()
+            results[f"blit_{name}_us"] = (time.perf_counter() - start) / blits * 1e6
+        loaded = pygame.image.load(os.path.join(root, "sol.jpg"))
+        converted = assets.surface("background")
+        for name, surface in (("bg_loaded", loaded), ("bg_converted", converted)):
+            start = time.perf_counter()
+            for _ in range(blits // 100):
+                screen.blit(surface, (0, 0))
+            results[f"blit_{name}_us"] = (time.perf_counter() - start) / (blits // 100) * 1e6
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+        pygame.quit()
+    return results
+
+
+def bench_collisions(wall_counts=(11, 100, 1000, 10000), queries=50000, seed=0):
+    # collides_with_walls queries per second for maps of growing wall count
+    results = {}
+    for wall_count in wall_counts:
+        level = random_level(wall_count, seed)
+        sim = new_match(level, seed)
+        rng = random.Random(seed)
+        points = [(rng.uniform(0, level.width - PLAYER_SIZE), rng.uniform(0, level.height - PLAYER_SIZE))
+                  for _ in range(queries)]
+        start = time.perf_counter()
+        for x, y in points:
+            sim.collides_with_walls(x, y)
+        elapsed = time.perf_counter() - start
+        results[str(wall_count)] = {"map_size": level.width, "queries_per_sec": queries / elapsed}
+    return results
+
+
+def bench_visibility(wall_counts=(11, 100, 1000, 10000), cells=300, seed=0):
+    # Line-of-sight polygon cost (one per cell crossed) and sight queries
+    # per second for maps of growing wall count
+    results = {}
+    for wall_count in wall_counts:
+        level = random_level(wall_count, seed)
+        sim = new_match(level, seed)
+        sight = VisibilityMap(sim.walls, sim.wall_grid)
+        rng = random.Random(seed)
+        visited = [sight.cell(rng.uniform(0, level.width), rng.uniform(0, level.height)) for _ in range(cells)]
+        times = []
+        for cell in visited:
+            start = time.perf_counter()
+            sight.polygon(cell)
+            times.append((time.perf_counter() - start) * 1000)
+        points = [(rng.uniform(0, level.width), rng.uniform(0, level.height)) for _ in range(64)]
+        start = time.perf_counter()
+        for cell in visited:
+            sight.sees(cell, points)
+        elapsed = time.perf_counter() - start
+        results[str(wall_count)] = {"map_size": level.width, **summarize(times),
+                                    "points_per_sec": cells * len(points) / elapsed}
+    return results
+
+
+def bench_entities(teams=((1, 1), (4, 4), (16, 16), (64, 64)), pickups=64, ticks=1000, seed=0):
+    # Simulation ticks per second with a growing number of hunters and
+    # ghosts (random walks, lamps on) among `pickups` batteries
+    results = {}
+    script = scripted_inputs(ticks, seed)
+    for hunters, ghosts in teams:
+        sim = new_match(seed=seed, hunters=hunters, ghosts=ghosts)
+        for _ in range(pickups):
+            battery = BatteryRecharge(*sim.battery_spawner.sample(sim.rng), 0)
+            battery.duration = float("inf")
+            sim.batteries.append(battery)
+        for hunter in sim.hunters:
+            hunter.lampe_on = True
+        rng = random.Random(seed)
+        extra_ids = list(sim.players)[2:]
+        for tick, inputs in enumerate(script):
+            if tick % 30 == 0:
+                extra = {player_id: (rng.choice(DIRECTIONS), rng.choice(DIRECTIONS), False)
+                         for player_id in extra_ids}
+            inputs.extra = extra
+        start = time.perf_counter()
+        for inputs in script:
+            sim.step(inputs)
+        elapsed = time.perf_counter() - start
+        results[f"{hunters}v{ghosts}"] = {"ticks_per_sec": ticks / elapsed,
+                                          "us_per_entity": elapsed / ticks / len(sim.players) * 1e6}
+    return results
+
+
+def bench_ai(counts=(1, 8, 32), ticks=1200, seed=0):
+    # Bot decision cost with a growing number of bot-vs-bot matches on one
+    # level, every bot sharing the same flow field cache, searches spread
+    # over ticks as on a server
+    results = {}
+    for count in counts:
+        flow = FlowFields(NavGrid(new_match(seed=seed).level))
+        matches = [new_match(seed=seed + i) for i in range(count)]
+        bots = [(HunterBot(flow, sim.chasseur), GhostBot(flow, sim.fantome)) for sim in matches]
+        decide = 0.0
+        start = time.perf_counter()
+        for _ in range(ticks):
+            decide_start = time.perf_counter()
+            flow.start_tick()
+            decide += time.perf_counter() - decide_start
+            for i, sim in enumerate(matches):
+                if sim.game_over:
+                    sim.reset()
+                    sim.fantome.points_de_vie = float("inf")
+                    sim.chasseur.drain_rate = 0
+                    bots[i] = (HunterBot(flow, sim.chasseur), GhostBot(flow, sim.fantome))
+                hunter, ghost = bots[i]
+                decide_start = time.perf_counter()
+                hunter_dx, hunter_dy, toggle = hunter.decide(sim)
+                ghost_dx, ghost_dy, _ = ghost.decide(sim)
+                decide += time.perf_counter() - decide_start
+                sim.step(Inputs(hunter_dx, hunter_dy, ghost_dx, ghost_dy, toggle))
+        elapsed = time.perf_counter() - start
+        results[str(count * 2)] = {"decide_us_per_bot": decide / (ticks * count * 2) * 1e6,
+                                   "match_ticks_per_sec": ticks * count / elapsed,
+                                   "fields_computed": flow.computed}
+    return results
+
+
+def record_bot_match(seed=0, max_ticks=TICK_RATE * 120):
+    # Replay of a bot-vs-bot match, for when no recording is given
+    sim = Simulation(seed=seed)
+    flow = FlowFields(NavGrid(sim.level))
+    hunter, ghost = HunterBot(flow, sim.chasseur), GhostBot(flow, sim.fantome)
+    recorder = Recorder(sim)
+    for _ in range(max_ticks):
+        if sim.game_over:
+            break
+        hunter_dx, hunter_dy, toggle = hunter.decide(sim)
+        ghost_dx, ghost_dy, _ = ghost.decide(sim)
+        inputs = Inputs(hunter_dx, hunter_dy, ghost_dx, ghost_dy, toggle)
+        recorder.add(inputs)
+        sim.step(inputs)
+    return recorder.finish()
+
+
+def bench_replay(paths=(), seed=0):
+    # Headless re-simulation of recorded matches (bench.py replay --replays
+    # FILE...), or of a bot match recorded on the spot: tick times, then a
+    # seek back to the middle through the snapshots taken on the way
+    replays = {os.path.basename(path): Replay.load(path) for path in paths} or {"bots": record_bot_match(seed)}
+    results = {}
+    for name, replay in replays.items():
+        runner = ReplayRunner(replay)
+        times = array('d', bytes(8 * len(replay)))
+        for i in range(len(replay)):
+            start = time.perf_counter()
+            runner.step()
+            times[i] = (time.perf_counter() - start) * 1000
+        stats = summarize(times)
+        stats["ticks"] = len(replay)
+        stats["desynced"] = float(runner.desynced())
+        start = time.perf_counter()
+        runner.seek(len(replay) // 2)
+        stats["seek_ms"] = (time.perf_counter() - start) * 1000
+        results[name] = stats
+    return results
+
+
+# Run by bench_startup in a fresh interpreter, like the lobby: prints the
+# ms from asking for a game to its first frame
+FIRST_FRAME = """
+import sys, time
+from launcher import GameProcess
+
+def wait(game, kind):
+    while not any(message[0] == kind for message in game.messages()):
+        if not game.running():
+            sys.exit("game process exited")
+        time.sleep(0.001)
+
+start = time.perf_counter()
+game = GameProcess()
+if sys.argv[1] == "warm":
+    wait(game, "preloaded")
+    start = time.perf_counter()
+game.start(ai_ghost=True)
+wait(game, "ready")
+print((time.perf_counter() - start) * 1000)
+game.process.terminate()
+"""
+
+
+def bench_startup(rounds=3, seed=0):
+    # Cold start, each round in fresh processes: the interpreter alone, the
+    # lobby module (which must not load pygame), and the first game frame
+    # from a new game process and from one preloaded in advance (Lobby)
+    root = os.path.dirname(os.path.abspath(__file__))
+    lobby = "import sys, Lobby; sys.exit('pygame' in sys.modules or 'numpy' in sys.modules)"
+    times = {"python": [], "lobby_import": [], "first_frame_cold": [], "first_frame_warm": []}
+    for _ in range(rounds):
+        for name, code in (("python", "pass"), ("lobby_import", lobby)):
+            start = time.perf_counter()
+            if subprocess.run([sys.executable, "-c", code], cwd=root).returncode:
+                raise RuntimeError("importing Lobby loads pygame or numpy")
+            times[name].append((time.perf_counter() - start) * 1000)
+        for mode in ("cold", "warm"):
+            output = subprocess.run([sys.executable, "-c", FIRST_FRAME, mode], cwd=root,
+                                    capture_output=True, text=True, check=True).stdout
+            times[f"first_frame_{mode}"].append(float(output.split()[-1]))
+    return {name: summarize(samples) for name, samples in times.items()}
+
+
+SUITES = {
+    "simulation": bench_simulation,
+    "render": bench_render,
+    "allocations": bench_allocations,
+    "restarts": bench_restarts,
+    "assets": bench_assets,
+    "collisions": bench_collisions,
+    "visibility": bench_visibility,
+    "entities": bench_entities,
+    "ai": bench_ai,
+    "replay": bench_replay,
+    "startup": bench_startup,
+}
+
+
+def print_results(results):
+    for suite, stats in results["suites"].items():
+        print(f"[{suite}]")
+        if "mean_ms" in stats:
+            stats = {"": stats}
+        for name, values in stats.items():
+            if not isinstance(values, dict):
+                print(f"  {name:24s} {values:.3f}")
+                continue
+            line = "  ".join(f"{key} {value:.3f}" for key, value in values.items())
+            print(f"  {name:24s} {line}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghost Chase headless benchmarks")
+    parser.add_argument("suites", nargs="*", metavar="SUITE",
+                        help=f"suites to run, among {', '.join(SUITES)} (all by default)")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON ('-' for stdout)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--replays", nargs="+", default=(), metavar="FILE",
+                        help="recorded matches for the replay suite (a bot match by default)")
+    args = parser.parse_args()
+    for name in args.suites:
+        if name not in SUITES:
+            parser.error(f"unknown suite {name!r}")
+
+    results = {
+        "timestamp": time.time(),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "suites": {},
+    }
+    for name in args.suites or SUITES:
+        suite = SUITES[name]
+        if name == "replay":
+            suite = functools.partial(suite, args.replays)
+        results["suites"][name] = suite(seed=args.seed)
+
+    if args.json == "-":
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    else:
+        print_results(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,436 @@
+# client.py
+import argparse
+import asyncio
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+from itertools import islice
+from level import load_level
+from profiler import RollingStats
+from simulation import Simulation, TICK_MS, TICK_RATE, facing_angle
+import protocol
+
+MAX_RESENT_INPUTS = 64  # Unacknowledged inputs carried by each INPUT packet
+VIEW_HISTORY = 64  # Snapshots kept as delta baselines
+SNAP_DISTANCE = 50  # A remote player that moved farther between two views is not interpolated
+SERVER_TIMEOUT = 5.0  # Seconds without a datagram before the server is considered gone
+
+
+class MirrorSimulation(Simulation):
+    # Client copy of a match. It is filled from server views and never runs
+    # the rules itself; only the local player's movement is predicted.
+    def __init__(self, level):
+        super().__init__(level)
+        self.detector = 0
+        self.hunter_seen = True  # False while the hunter is out of the ghost's sight
+
+    def detector_distance(self, hunter):
+        return self.detector
+
+
+class NetClient:
+    # Client side of the protocol, independent of the transport: `send` is
+    # called with outgoing datagrams and handle() with incoming ones. A
+    # REDIRECT leaves the new port in `redirect` for the transport to follow.
+    def __init__(self, send, room_id=protocol.ANY_ROOM):
+        self.send_datagram = send
+        self.room_id = room_id
+        self.redirect = None
+        self.refused = None
+        self.player_id = None
+        self.snapshot_every = None
+        self.sim = None
+        self.seq = 0
+        self.pending = deque()  # (sequence, packed input) not applied by the server yet
+        self.sent_at = {}  # Sequence -> send time, for the latency
+        self.views = {}  # Tick -> view received
+        self.acked_tick = protocol.NO_BASELINE
+        # Remote players are shown one view late, moving from where they
+        # were drawn to the last view over a snapshot interval:
+        # player id -> (from x, from y, to x, to y)
+        self.remote = {}
+        self.ticks_since_view = 0
+        self.latency = RollingStats(1000)  # Input to server acknowledgement, ms
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.snapshots = 0
+        self.dropped_snapshots = 0
+
+    def send(self, data):
+        self.bytes_sent += len(data)
+        self.send_datagram(data)
+
+    def hello(self):
+        self.send(protocol.encode_hello(self.room_id))
+
+    def bye(self):
+        self.send(protocol.encode_bye())
+
+    @property
+    def player(self):
+        return self.sim.players.get(self.player_id) if self.sim else None
+
+    def handle(self, data):
+        self.bytes_received += len(data)
+        kind = protocol.packet_type(data)
+        if kind == protocol.WELCOME and self.player_id is None:
+            self.player_id, self.snapshot_every, self.room_id, level_name = protocol.decode_welcome(data)
+            self.sim = MirrorSimulation(load_level(level_name))
+        elif kind == protocol.SNAPSHOT and self.sim is not None:
+            self.receive_snapshot(data)
+        elif kind == protocol.REDIRECT and self.player_id is None:
+            self.redirect = protocol.decode_redirect(data)
+        elif kind == protocol.REFUSED and self.player_id is None:
+            self.refused = protocol.decode_refused(data)
+
+    def receive_snapshot(self, data):
+        decoded = protocol.decode_snapshot(data, self.views)
+        if decoded is None:
+            self.dropped_snapshots += 1
+            return
+        tick, last_seq, view = decoded
+        if self.acked_tick != protocol.NO_BASELINE and tick <= self.acked_tick:
+            return  # Late datagram
+        self.snapshots += 1
+        self.views[tick] = view
+        self.acked_tick = tick
+        if len(self.views) > VIEW_HISTORY:
+            del self.views[min(self.views)]
+
+        now = time.perf_counter()
+        while self.pending and self.pending[0][0] <= last_seq:
+            seq, _ = self.pending.popleft()
+            sent_at = self.sent_at.pop(seq, None)
+            if sent_at is not None:
+                self.latency.add((now - sent_at) * 1000)
+
+        # apply_view puts everyone at the server position with no motion to
+        # interpolate: reconcile gives the local player its last predicted
+        # step back, remote players start from where they are drawn
+        drawn = {player_id: (player.x, player.y, player.prev_x, player.prev_y)
+                 for player_id, player in self.sim.players.items()}
+        known = self.sim.fantome.visible or self.player_id == protocol.GHOST
+        hunter_known = self.sim.hunter_seen
+        protocol.apply_view(self.sim, view)
+        self.reconcile()
+        for player_id, player in self.sim.players.items():
+            x, y, prev_x, prev_y = drawn[player_id]
+            if player_id == self.player_id:
+                continue
+            if (player is self.sim.fantome and not known
+                    or player is self.sim.chasseur and not (hunter_known and self.sim.hunter_seen)):
+                self.remote.pop(player_id, None)  # Appears where it is seen
+                continue
+            if math.hypot(player.x - x, player.y - y) > SNAP_DISTANCE:
+                self.remote.pop(player_id, None)  # Restart or respawn
+                continue
+            self.remote[player_id] = (x, y, player.x, player.y)
+            player.x, player.y, player.prev_x, player.prev_y = x, y, prev_x, prev_y
+        self.ticks_since_view = 0
+
+    def reconcile(self):
+        # Server state is as of the last applied input: replay the newer ones.
+        # prev ends before the last replayed input, so draw() interpolates one
+        # tick of motion as it does between two predicted ticks
+        player = self.player
+        if player is None:
+            return
+        for _, value in self.pending:
+            dx, dy, _ = protocol.unpack_input(value)
+            player.prev_x, player.prev_y = player.x, player.y
+            self.sim.move_body(player, *self.sim.normalize(dx, dy), TICK_MS)
+            if player.type == 'chasseur':
+                player.facing = facing_angle(dx, dy)
+
+    def advance_remote(self):
+        # One local tick of the remote players' interpolation
+        self.ticks_since_view += 1
+        t = min(1.0, self.ticks_since_view / self.snapshot_every)
+        for player_id, (from_x, from_y, to_x, to_y) in self.remote.items():
+            player = self.sim.players[player_id]
+            player.prev_x, player.prev_y = player.x, player.y
+            player.x = from_x + (to_x - from_x) * t
+            player.y = from_y + (to_y - from_y) * t
+
+    def send_input(self, dx, dy, toggle_lamp=False):
+        # One call per local tick: predict the move and send it
+        if self.sim is None:
+            return
+        self.advance_remote()
+        self.seq += 1
+        value = protocol.pack_input(dx, dy, toggle_lamp)
+        self.pending.append((self.seq, value))
+        self.sent_at[self.seq] = time.perf_counter()
+
+        player = self.player
+        if player is not None and not self.sim.game_over:
+            player.prev_x = player.x
+            player.prev_y = player.y
+            self.sim.move_body(player, *self.sim.normalize(dx, dy), TICK_MS)
+            if player.type == 'chasseur':
+                player.facing = facing_angle(dx, dy)
+
+        first_seq = self.pending[0][0]
+        inputs = [value for _, value in islice(self.pending, MAX_RESENT_INPUTS)]
+        self.send(protocol.encode_input(self.acked_tick, first_seq, inputs))
+
+
+class UdpConnection:
+    # Non-blocking socket polled once per frame by the pygame client
+    def __init__(self, host, port, room_id=protocol.ANY_ROOM):
+        self.host = host
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.socket.connect((host, port))
+        self.socket.setblocking(False)
+        self.client = NetClient(self.send, room_id)
+        self.last_received = time.monotonic()
+
+    def send(self, data):
+        try:
+            self.socket.send(data)
+        except ConnectionRefusedError:
+            pass  # Reported for an earlier datagram, poll() gives up if it lasts
+
+    def poll(self):
+        # Raises ConnectionError once in a match when the server stops
+        # sending: it sends snapshots all the time, even between matches
+        while True:
+            try:
+                data = self.socket.recv(65536)
+            except (BlockingIOError, ConnectionRefusedError):
+                break  # Refused: nobody on the port (yet), as good as silence
+            self.last_received = time.monotonic()
+            self.client.handle(data)
+        if self.client.sim is not None and time.monotonic() - self.last_received > SERVER_TIMEOUT:
+            raise ConnectionError("the server stopped answering")
+
+    def connect(self, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while self.client.sim is None:
+            if time.monotonic() > deadline:
+                raise ConnectionError("no answer from the server")
+            self.client.hello()
+            time.sleep(0.1)
+            self.poll()
+            if self.client.refused is not None:
+                raise ConnectionError(protocol.REFUSED_REASONS.get(self.client.refused, "refused"))
+            if self.client.redirect is not None:
+                self.socket.connect((self.host, self.client.redirect))
+                self.client.redirect = None
+        return self.client
+
+    def close(self):
+        self.client.bye()
+        self.socket.close()
+
+
+def fetch_rooms(host, port, timeout=1.0):
+    # Room list of a server or match host: [(room id, port, players mask,
+    # finished)], fetched a page at a time
+    rooms = []
+    total = None
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect((host, port))
+        while total is None or len(rooms) < total:
+            sock.send(protocol.encode_list(len(rooms)))
+            while True:
+                data = sock.recv(65536)  # socket.timeout is left to the caller
+                if protocol.packet_type(data) == protocol.ROOMS:
+                    break
+            total, offset, page = protocol.decode_rooms(data)
+            if offset != len(rooms) or not page:
+                break  # The list changed under us, keep what we have
+            rooms += page
+    return rooms
+
+
+def play(host, port, room_id=protocol.ANY_ROOM, on_result=None, on_ready=None):
+    # Thin pygame client: local input and prediction, server-driven state.
+    # on_result is called with the winner each time a match ends, on_ready
+    # once the first frame is shown.
+    import pygame
+    from game import Game, FRAME_RATE
+
+    connection = UdpConnection(host, port, room_id)
+    client = connection.connect()
+    game = Game(sim=client.sim, player_id=client.player_id, on_ready=on_ready)
+    role = "Chasseur" if client.player_id == protocol.HUNTER else "Fantôme"
+    pygame.display.set_caption(f"Ghost Chase - {role} - salle {client.room_id}")
+
+    accumulator = 0.0
+    toggle_lamp = False
+    game_over = False
+    profiler = game.profiler
+    game.clock.tick()
+    try:
+        while True:
+            profiler.begin_frame()
+            for event in pygame.event.get():
+                if event.type == pygame.QUIT:
+                    return
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_l:
+                    toggle_lamp = True
+                elif event.type == pygame.KEYDOWN and event.key == pygame.K_q and client.sim.game_over:
+                    return  # connection.close() says BYE
+            profiler.lap("events")
+
+            # Each player has a keyboard: arrows or WASD move the local player
+            inputs = game.read_inputs(False)
+            dx = inputs.hunter_dx or inputs.ghost_dx
+            dy = inputs.hunter_dy or inputs.ghost_dy
+            profiler.lap("input")
+
+            frame_time = game.clock.tick(FRAME_RATE)
+            accumulator += min(frame_time, 250)
+            profiler.lap("wait")
+            # Match telemetry is the server's, the client only has frames
+            game.metrics.count("frames")
+            game.metrics.observe("frame_ms", frame_time)
+            while accumulator >= TICK_MS:
+                client.send_input(dx, dy, toggle_lamp)
+                toggle_lamp = False
+                accumulator -= TICK_MS
+            connection.poll()
+            if client.sim.game_over and not game_over:
+                game.next_match_at = time.monotonic() + protocol.RESTART_DELAY
+                if on_result:
+                    on_result(client.sim.winner)
+            game_over = client.sim.game_over
+            profiler.lap("update")
+            game.draw(min(accumulator / TICK_MS, 1.0))
+            profiler.end_frame()
+            if game.metrics_file:
+                game.metrics_file.poll()
+    finally:
+        if game.metrics_file:
+            game.metrics_file.write()
+        connection.close()
+        pygame.quit()
+
+
+class AsyncClient(asyncio.DatagramProtocol):
+    # NetClient on an asyncio transport, for load tests
+    def __init__(self, address, room_id=protocol.ANY_ROOM):
+        self.address = address
+        self.room_id = room_id
+        self.client = None
+
+    def connection_made(self, transport):
+        self.client = NetClient(lambda data: transport.sendto(data, self.address), self.room_id)
+        self.client.hello()
+
+    def datagram_received(self, data, address):
+        if address != self.address:
+            return  # Late answer from the match host after a redirect
+        self.client.handle(data)
+        if self.client.redirect is not None:
+            self.address = (self.address[0], self.client.redirect)
+            self.client.redirect = None
+            self.client.hello()
+
+
+async def loadtest(host, port, count, duration, seed=0):
+    # Many scripted clients on one event loop; reports bandwidth and latency
+    loop = asyncio.get_running_loop()
+    host = socket.gethostbyname(host)  # Replies are matched on the address
+    transports = []
+    clients = []
+    for _ in range(count):
+        transport, endpoint = await loop.create_datagram_endpoint(
+            lambda: AsyncClient((host, port)), local_addr=("0.0.0.0", 0))
+        transports.append(transport)
+        clients.append(endpoint.client)
+
+    deadline = time.monotonic() + 5
+    while any(client.sim is None for client in clients):
+        if time.monotonic() > deadline:
+            raise ConnectionError("clients were not welcomed in time")
+        for client in clients:
+            if client.sim is None:
+                client.hello()
+        await asyncio.sleep(0.1)
+
+    rng = random.Random(seed)
+    directions = [(0, 0)] * count
+    period = TICK_MS / 1000
+    ticks = int(duration * TICK_RATE)
+    start = time.perf_counter()
+    bytes_before = [(client.bytes_sent, client.bytes_received) for client in clients]
+    next_tick = start
+    for tick in range(ticks):
+        for i, client in enumerate(clients):
+            if tick % 30 == 0:
+                directions[i] = (rng.choice((-1, 0, 1)), rng.choice((-1, 0, 1)))
+            client.send_input(*directions[i], toggle_lamp=tick % 600 == i % 600)
+        next_tick += period
+        await asyncio.sleep(max(0.0, next_tick - time.perf_counter()))
+    elapsed = time.perf_counter() - start
+
+    for client in clients:
+        client.bye()
+    await asyncio.sleep(0.1)
+    for transport in transports:
+        transport.close()
+
+    latencies = sorted(value for client in clients for value in client.latency.values())
+    sent = sum(client.bytes_sent - before[0] for client, before in zip(clients, bytes_before))
+    received = sum(client.bytes_received - before[1] for client, before in zip(clients, bytes_before))
+    return {
+        "clients": count,
+        "seconds": elapsed,
+        "upload_bytes_per_client_sec": sent / count / elapsed,
+        "download_bytes_per_client_sec": received / count / elapsed,
+        "snapshots_per_client_sec": sum(client.snapshots for client in clients) / count / elapsed,
+        "undecodable_snapshots": sum(client.dropped_snapshots for client in clients),
+        "latency_p50_ms": latencies[len(latencies) // 2] if latencies else None,
+        "latency_p99_ms": latencies[int(len(latencies) * 0.99)] if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghost Chase network client")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5656)
+    parser.add_argument("--room", type=int, default=protocol.ANY_ROOM,
+                        help="room to join (default: pair with anyone waiting)")
+    parser.add_argument("--rooms", action="store_true", help="list the rooms and exit")
+    parser.add_argument("--loadtest", type=int, metavar="CLIENTS",
+                        help="run scripted headless clients instead of playing")
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--spawn-server", action="store_true",
+                        help="start a local server for the load test")
+    args = parser.parse_args()
+
+    if args.rooms:
+        for room_id, port, players, finished in fetch_rooms(args.host, args.port):
+            seats = "+".join(name for bit, name in ((1, "hunter"), (2, "ghost")) if players & bit)
+            print(f"room {room_id:6d}  port {port}  {seats or 'empty':12s} {'finished' if finished else ''}")
+        return
+    if args.loadtest is None:
+        play(args.host, args.port, args.room)
+        return
+
+    server = None
+    if args.spawn_server:
+        server_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "server.py")
+        server = subprocess.Popen([sys.executable, server_path, "--host", args.host,
+                                   "--port", str(args.port), "--report", "2"])
+        time.sleep(1.0)
+    try:
+        results = asyncio.run(loadtest(args.host, args.port, args.loadtest, args.duration))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    for key, value in results.items():
+        print(f"{key:32s} {value:.3f}" if isinstance(value, float) else f"{key:32s} {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,35 +1,66 @@
 # entities.py
-import pygame
 import math
 import random
 
+# Entities are __slots__ records: no per-instance dict, fixed attribute
+# offsets, and FIELDS lists every attribute for state snapshots
+# (Simulation.state), so matches with many players stay compact.
+
 class Entity:
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'speed', 'points_de_vie', 'type', 'alive')
+    FIELDS = __slots__
+
     def __init__(self, x, y, speed, points_de_vie, type):
         self.x = x
         self.y = y  # Fixed: was using x instead of y
-        self.speed = speed
+        self.prev_x = x  # Position at the previous tick, for render interpolation
+        self.prev_y = y
+        self.speed = speed  # Pixels per second
         self.points_de_vie = points_de_vie
         self.type = type
         self.alive = True  # Added alive property for all entities
 
+    def get_state(self):
+        return tuple(getattr(self, name) for name in self.FIELDS)
+
+    def set_state(self, values):
+        for name, value in zip(self.FIELDS, values):
+            setattr(self, name, value)
+
 class Chasseur(Entity):
+    __slots__ = ('lampe_on', 'batterie_lampe', 'drain_rate', 'facing', 'derniere_utilisation_lampe',
+                 'lamp_uses', 'lamp_time', 'pickups')
+    FIELDS = Entity.FIELDS + __slots__
+
     def __init__(self, x, y):
-        super().__init__(x, y, speed=2, points_de_vie=100, type='chasseur')
+        super().__init__(x, y, speed=120, points_de_vie=100, type='chasseur')
         self.lampe_on = False
         self.batterie_lampe = 100
-        
-    def use_light(self):
+        self.drain_rate = 30  # Battery percent per second of light
+        self.facing = 0.0  # Lamp direction (radians)
+        self.derniere_utilisation_lampe = -math.inf  # Time of the last lamp toggle (ms)
+        # Match telemetry (metrics.py)
+        self.lamp_uses = 0  # Times the lamp was switched on
+        self.lamp_time = 0.0  # ms of light
+        self.pickups = 0  # Battery recharges collected
+
+    def use_light(self, dt):
         if self.batterie_lampe > 0:
-            self.batterie_lampe -= 0.5  # Drain battery gradually
+            self.batterie_lampe -= self.drain_rate * dt / 1000  # Drain battery gradually
+            self.lamp_time += dt
             return True
         else:
             self.lampe_on = False
             return False
 
 class Fantome(Entity):
+    __slots__ = ('visible', 'lit')
+    FIELDS = Entity.FIELDS + __slots__
+
     def __init__(self, x, y):
-        super().__init__(x, y, speed=1, points_de_vie=10, type='fantome')
-        self.visible = False  # Add visibility property
+        super().__init__(x, y, speed=60, points_de_vie=10, type='fantome')
+        self.visible = False  # Seen by a hunter during the last tick
+        self.lit = False  # In a lamp's light during the last tick
 
     def take_damage(self, amount):
         self.points_de_vie -= amount
@@ -37,8 +68,20 @@ class Fantome(Entity):
             self.alive = False
 
 class BatteryRecharge:
-    def __init__(self, x, y):
+    __slots__ = ('x', 'y', 'spawn_time', 'duration')
+    FIELDS = __slots__
+
+    def __init__(self, x, y, spawn_time):
         self.x = x
         self.y = y
-        self.spawn_time = pygame.time.get_ticks()
-        self.duration = 15000  # Increased duration to 15 seconds
\ No newline at end of file
+        self.spawn_time = spawn_time  # Simulation time in ms
+        self.duration = 15000  # Increased duration to 15 seconds
+
+    get_state = Entity.get_state
+    set_state = Entity.set_state
+
+    @classmethod
+    def from_state(cls, values):
+        battery = cls.__new__(cls)
+        battery.set_state(values)
+        return battery
\ No newline at end of file
@@ -1,202 +1,140 @@
 # game.py
 import pygame
 import math
-import random
 import os
-from entities import Chasseur, Fantome, BatteryRecharge
+import time
+from simulation import Simulation, Inputs, TICK_MS, PLAYER_SIZE
+from lighting import LightRenderer
+from hud import TextCache, ProfileOverlay
+from profiler import FrameProfiler, NULL_PROFILER
+from metrics import Metrics, MetricsFile, NULL_METRICS
+from scene import StaticScene, DirtyRects
+from visibility import VisibilityMap
+from assets import ASSETS
+from ai import GhostBot, flow_fields_for
+from replay import Recorder
+
+FRAME_RATE = 60  # Render rate cap, independent of the simulation tick rate
+MAX_FRAME_TIME = 250  # ms of simulation caught up at most after a stall
+
+# Session states of Game.run
+MATCH, GAME_OVER, QUIT = range(3)
 
 class Game:
-    def __init__(self):
-        pygame.init()
-        self.screen = pygame.display.set_mode((800, 600))
+    def __init__(self, profile=None, sim=None, player_id=None, on_result=None, ai_ghost=False,
+                 record=None, metrics=None, on_ready=None):
+        # Only the subsystems the game uses: no audio, joystick...
+        pygame.display.init()
+        pygame.font.init()
+
+        # Initialize game state (the simulation never touches the display)
+        self.sim = sim or Simulation()
+        # Local player in a networked game, None when both share the keyboard
+        self.player_id = player_id
+        # Networked game over: time.monotonic() at which the server restarts
+        self.next_match_at = None
+        # Called with the winner at the end of each match (lobby reporting),
+        # and once the first frame is on screen
+        self.on_result = on_result
+        self.on_ready = on_ready
+        # Ghost driven by the AI instead of WASD
+        self.ai_ghost = ai_ghost
+        self.ghost_bot = None
+        self.new_ghost_bot()
+        # Local matches recorded as replays into this directory:
+        # Game(record=DIR) or GHOSTCHASE_RECORD=DIR
+        if record is None:
+            record = os.environ.get("GHOSTCHASE_RECORD") or None
+        self.record_dir = record if player_id is None else None
+
+        # Opt-in frame profiling: Game(profile=True) or GHOSTCHASE_PROFILE=1
+        if profile is None:
+            profile = os.environ.get("GHOSTCHASE_PROFILE", "") not in ("", "0")
+        self.profiler = FrameProfiler() if profile else NULL_PROFILER
+        self.sim.profiler = self.profiler
+
+        # Opt-in telemetry, dumped to a file every few seconds:
+        # Game(metrics=FILE) or GHOSTCHASE_METRICS=FILE
+        if metrics is None:
+            metrics = os.environ.get("GHOSTCHASE_METRICS") or None
+        self.metrics = Metrics() if metrics else NULL_METRICS
+        self.metrics_file = MetricsFile(metrics, self.metrics.text) if metrics else None
+
+        self.screen = pygame.display.set_mode((self.sim.level.width, self.sim.level.height))
         pygame.display.set_caption("Ghost Chase")
         self.clock = pygame.time.Clock()
 
-        # Initialize game state
-        self.chasseur = Chasseur(100, 100)
-        self.fantome = Fantome(400, 400)
-        self.players = {1: self.chasseur, 2: self.fantome}
+        # Images, loaded once per process
+        self.load_images()
 
-        self.game_over = False
-        self.winner = None
-        self.generate_walls()
-        self.battery_recharge = None
-        self.last_spawn_time = pygame.time.get_ticks()
-        self.recharge_interval = 15000
-        self.derniere_utilisation_lampe = 0
+        # Background and walls baked once, frames only redraw what moves
+        self.scene = StaticScene(self.background_image, self.sim.walls, self.screen.get_size())
+        self.dirty = DirtyRects()
 
-        # Load images with error handling
-        self.load_images()
+        # Fog of war: what the local player (the hunter when both share the
+        # keyboard) sees, rebaked into the scene when it enters another cell
+        self.sight = VisibilityMap(self.sim.walls, self.sim.wall_grid)
+        self.sight_cell = None
         
-        # Font for UI elements
-        self.font = pygame.font.Font(None, 24)
+        # Fonts and rendered text for UI elements
+        self.text = TextCache()
+
+        # Game over dimming, built once
+        self.overlay = pygame.Surface(self.screen.get_size(), pygame.SRCALPHA)
+        self.overlay.fill((0, 0, 0, 180))
+
+        # Pre-rendered flashlight cones
+        self.light = LightRenderer()
+
+        # Frame timings overlay, toggled with F3 when profiling
+        self.profile_overlay = ProfileOverlay(self.profiler, self.text) if profile else None
+        self.show_profile = False
 
     def load_images(self):
-        # Default to colored rectangles if images not found
-        self.ghost_image = pygame.Surface((20, 20))
-        self.ghost_image.fill((200, 200, 255))
-        self.hunter_image = pygame.Surface((20, 20))
-        self.hunter_image.fill((255, 200, 100))
-        self.background_image = pygame.Surface((800, 600))
-        self.background_image.fill((50, 50, 50))
-        
-        # Try to load images if they exist
-        try:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            img_paths = {
-                "ghost": ["fantome.png", "assets/fantome.png"],
-                "hunter": ["chasseur.png", "assets/chasseur.png"],
-                "background": ["sol.jpg", "assets/sol.jpg", "background.jpg", "assets/background.jpg"]
-            }
-            
-            for entity, paths in img_paths.items():
-                for path in paths:
-                    try:
-                        full_path = os.path.join(current_dir, path)
-                        if os.path.exists(full_path):
-                            if entity == "ghost":
-                                self.ghost_image = pygame.image.load(full_path)
-                            elif entity == "hunter":
-                                self.hunter_image = pygame.image.load(full_path)
-                            elif entity == "background":
-                                self.background_image = pygame.image.load(full_path)
-                            break
-                    except pygame.error:
-                        continue
-        except Exception as e:
-            print(f"Error loading images: {e}")
-
-    def generate_walls(self):
-        self.walls = [
-            {'x': 300, 'y': 100, 'width': 200, 'height': 20},
-            {'x': 100, 'y': 300, 'width': 20, 'height': 200},
-            {'x': 400, 'y': 400, 'width': 200, 'height': 20},
-            {'x': 200, 'y': 200, 'width': 20, 'height': 150},
-            {'x': 500, 'y': 200, 'width': 20, 'height': 150},
-            {'x': 250, 'y': 100, 'width': 20, 'height': 100},
-            {'x': 450, 'y': 100, 'width': 20, 'height': 100},
-            # Border walls
-            {'x': 0, 'y': 0, 'width': 800, 'height': 20},
-            {'x': 0, 'y': 0, 'width': 20, 'height': 600},
-            {'x': 780, 'y': 0, 'width': 20, 'height': 600},
-            {'x': 0, 'y': 580, 'width': 800, 'height': 20}
-        ]
-
-    def update(self):
-        current_time = pygame.time.get_ticks()
-
-        # Update hunter's flashlight
-        if self.chasseur.lampe_on:
-            if not self.chasseur.use_light():
-                self.chasseur.lampe_on = False
-        
-        # Spawn battery recharge if needed
-        if not self.battery_recharge and current_time - self.last_spawn_time > self.recharge_interval:
-            self.last_spawn_time = current_time
-            valid_pos = False
-            while not valid_pos:
-                x = random.randint(50, 750)
-                y = random.randint(50, 550)
-                if not self.collides_with_walls(x, y):
-                    valid_pos = True
-            self.battery_recharge = BatteryRecharge(x, y)
-            
-        # Remove battery recharge if expired
-        if self.battery_recharge and current_time - self.battery_recharge.spawn_time > self.battery_recharge.duration:
-            self.battery_recharge = None
-
-        # Check if game is over
-        if not self.fantome.alive:
-            self.game_over = True
-            self.winner = "Chasseur"
-        elif not self.chasseur.alive:
-            self.game_over = True
-            self.winner = "Fantôme"
-
-    def move_player(self, player, dx, dy):
-        new_x = player.x + dx * player.speed
-        new_y = player.y + dy * player.speed
-        if not self.collides_with_walls(new_x, new_y):
-            player.x = new_x
-            player.y = new_y
-        self.check_collision(player)
-
-    def collides_with_walls(self, x, y):
-        player_size = 20  # Approximate player size
-        for wall in self.walls:
-            if (x < wall['x'] + wall['width'] and
-                x + player_size > wall['x'] and
-                y < wall['y'] + wall['height'] and
-                y + player_size > wall['y']):
-                return True
-        return False
-
-    def draw_light_cone(self, screen, player):
-        light_color = (255, 255, 150, 100)  # Added transparency
-        light_radius = 200
-        light_angle = 60  # Wider angle for better playability
-        
-        # Get player direction
-        dx, dy = 0, 0
-        keys = pygame.key.get_pressed()
-        if keys[pygame.K_LEFT]:
-            dx = -1
-        elif keys[pygame.K_RIGHT]:
-            dx = 1
-        if keys[pygame.K_UP]:
-            dy = -1
-        elif keys[pygame.K_DOWN]:
-            dy = 1
-        
-        # Calculate angle based on direction
-        if dx == 0 and dy == 0:
-            angle = 0  # Default direction
-        elif dx == 0:
-            angle = 90 if dy > 0 else 270
-        elif dy == 0:
-            angle = 0 if dx > 0 else 180
-        else:
-            angle = math.degrees(math.atan2(dy, dx))
-            
-        # Convert to radians
-        angle_rad = math.radians(angle)
-        half_angle_rad = math.radians(light_angle / 2)
-        
-        # Create a semi-transparent surface for the light
-        light_surface = pygame.Surface((800, 600), pygame.SRCALPHA)
-        
-        # Draw the light cone
-        start_pos = (player.x + 10, player.y + 10)
-        points = [start_pos]
-        
-        # Add points along the arc
-        for i in range(21):  # More points for smoother cone
-            angle_i = angle_rad - half_angle_rad + i * (2 * half_angle_rad / 20)
-            end_pos = (player.x + 10 + light_radius * math.cos(angle_i),
-                        player.y + 10 + light_radius * math.sin(angle_i))
-            points.append(end_pos)
-            
-        # Draw the light cone on the transparent surface
-        pygame.draw.polygon(light_surface, light_color, points)
-        screen.blit(light_surface, (0, 0))
-        
-        # Check if ghost is in light
-        ghost_center_x = self.fantome.x + 10
-        ghost_center_y = self.fantome.y + 10
-        
-        # Check if ghost is in range
-        distance = math.sqrt((player.x + 10 - ghost_center_x)**2 + (player.y + 10 - ghost_center_y)**2)
-        if distance > light_radius:
-            return False
-            
-        # Check if ghost is in the cone angle
-        ghost_angle = math.atan2(ghost_center_y - (player.y + 10), ghost_center_x - (player.x + 10))
-        angle_diff = abs((ghost_angle - angle_rad + math.pi) % (2 * math.pi) - math.pi)
-        
-        if angle_diff <= half_angle_rad:
-            self.fantome.visible = True
-            return True
-        return False
+        # Decoded once per process (see assets.py), converted to the display
+        # format; hunter and ghost share an atlas
+        sprites = ASSETS.sprites(("hunter", "ghost"))
+        self.hunter_sprite = sprites["hunter"]
+        self.ghost_sprite = sprites["ghost"]
+        self.background_image = ASSETS.surface("background")
+
+    def draw_light_cone(self, screen, x, y):
+        # Direction is owned by the simulation (last hunter input)
+        return self.light.draw(screen, x, y, self.sim.chasseur.facing)
+
+    @staticmethod
+    def interpolate(entity, alpha):
+        # Render position between the last two simulation ticks
+        return (entity.prev_x + (entity.x - entity.prev_x) * alpha,
+                entity.prev_y + (entity.y - entity.prev_y) * alpha)
+
+    def viewer(self):
+        if self.player_id is None:
+            return self.sim.chasseur
+        return self.sim.players[self.player_id]
+
+    def update_sight(self):
+        # Cell the local player sees from, None once the match is over (the
+        # whole map is shown)
+        sim = self.sim
+        cell = None
+        if not sim.game_over:
+            viewer = self.viewer()
+            cell = self.sight.cell(viewer.x + PLAYER_SIZE / 2, viewer.y + PLAYER_SIZE / 2)
+        if cell != self.sight_cell:
+            self.sight_cell = cell
+            changed = self.scene.set_sight(None if cell is None else self.sight.polygon(cell))
+            if changed is None:
+                self.dirty.invalidate()
+            else:
+                self.dirty.expose(changed)
+        return cell
+
+    def seen(self, points):
+        # Mask of the points in the local player's sight
+        if self.sight_cell is None:
+            return [True] * len(points)
+        return self.sight.sees(self.sight_cell, points).tolist()
 
     def draw_battery(self, screen, player):
         battery_width = 100
@@ -221,10 +159,11 @@ class Game:
         pygame.draw.rect(screen, battery_color, (battery_x + 2, battery_y + 2, fill_width, battery_height - 4))
         
         # Draw battery text
-        battery_text = self.font.render(f"{int(player.batterie_lampe)}%", True, (255, 255, 255))
-        screen.blit(battery_text, (battery_x + battery_width/2 - 20, battery_y + 2))
+        battery_text = self.text.render(f"{int(player.batterie_lampe)}%")
+        text_rect = screen.blit(battery_text, (battery_x + battery_width/2 - 20, battery_y + 2))
+        return text_rect.union((battery_x, battery_y, battery_width, battery_height))
 
-    def draw_ghost_detector(self, screen, player, ghost):
+    def draw_ghost_detector(self, screen, player):
         max_distance = 400
         detector_width = 150
         detector_height = 20
@@ -233,8 +172,7 @@ class Game:
         border_color = (200, 200, 200)
         
         # Calculate distance between hunter and ghost
-        distance = math.sqrt((player.x - ghost.x) ** 2 + (player.y - ghost.y) ** 2)
-        distance = min(distance, max_distance)
+        distance = min(self.sim.detector_distance(player), max_distance)
         
         # Choose color based on proximity
         if distance < 100:
@@ -254,173 +192,238 @@ class Game:
         pygame.draw.rect(screen, detector_color, (detector_x + 2, detector_y + 2, fill_width, detector_height - 4))
         
         # Draw detector text
-        detector_text = self.font.render("Ghost Detector", True, (255, 255, 255))
-        screen.blit(detector_text, (detector_x, detector_y + detector_height + 2))
-
-    def check_collision(self, player):
-        # Check hunter-ghost collision
-        if player.type == 'chasseur':
-            # Check if flashlight hits ghost
-            if player.lampe_on:
-                ghost_in_light = self.draw_light_cone(self.screen, player)
-                if ghost_in_light:
-                    self.fantome.take_damage(0.05)  # Reduced damage rate for better gameplay
-                    
-            # Check if ghost caught hunter
-            distance = math.sqrt((player.x - self.fantome.x) ** 2 + (player.y - self.fantome.y) ** 2)
-            if distance < 20:  # Adjusted collision distance
-                self.chasseur.alive = False
-                
-        # Check if hunter collects battery
-        if player.type == 'chasseur' and self.battery_recharge:
-            distance = math.sqrt((player.x - self.battery_recharge.x) ** 2 + 
-                                 (player.y - self.battery_recharge.y) ** 2)
-            if distance < 30:
-                player.batterie_lampe = min(100, player.batterie_lampe + 50)
-                self.battery_recharge = None
-
-    def draw(self):
-        # Draw background
-        self.screen.blit(self.background_image, (0, 0))
-        
-        # Draw walls
-        for wall in self.walls:
-            pygame.draw.rect(self.screen, (180, 180, 180), 
-                            (wall['x'], wall['y'], wall['width'], wall['height']))
+        detector_text = self.text.render("Ghost Detector")
+        text_rect = screen.blit(detector_text, (detector_x, detector_y + detector_height + 2))
+        return text_rect.union((detector_x, detector_y, detector_width, detector_height))
+
+    def draw(self, alpha=1.0):
+        sim = self.sim
+        screen = self.screen
+        dirty = self.dirty
+        hunter_x, hunter_y = self.interpolate(sim.chasseur, alpha)
+        ghost_x, ghost_y = self.interpolate(sim.fantome, alpha)
+        self.update_sight()
+        viewer = self.viewer()
+
+        # The game over overlay covers the whole screen
+        if sim.game_over:
+            dirty.invalidate()
+
+        # Draw background and walls, or only restore them where things moved
+        if dirty.full_redraw:
+            self.scene.draw(screen)
+        else:
+            self.scene.restore(screen, dirty.previous)
             
-        # Draw battery recharge
-        if self.battery_recharge:
-            pygame.draw.circle(self.screen, (0, 255, 255), 
-                              (self.battery_recharge.x, self.battery_recharge.y), 10)
+        # Draw battery recharges in sight
+        half_size = PLAYER_SIZE / 2
+        for battery, seen in zip(sim.batteries, self.seen([(battery.x, battery.y) for battery in sim.batteries])):
+            if seen:
+                dirty.add(pygame.draw.circle(screen, (0, 255, 255), (battery.x, battery.y), 10))
             
-        # Draw Hunter and light cone if active
-        if self.chasseur.alive:
-            self.screen.blit(self.hunter_image, (self.chasseur.x, self.chasseur.y))
-            if self.chasseur.lampe_on:
-                self.draw_light_cone(self.screen, self.chasseur)
+        # Draw Hunter and light cone if active, for the ghost player only in
+        # sight (networked, the server only sends it then: hunter_seen)
+        if sim.chasseur.alive and (viewer is sim.chasseur
+                                   or sim.hunter_seen
+                                   and self.seen([(hunter_x + half_size, hunter_y + half_size)])[0]):
+            sprite = self.hunter_sprite
+            dirty.add(screen.blit(sprite.surface, (hunter_x, hunter_y), sprite.area))
+            if sim.chasseur.lampe_on:
+                dirty.add(self.draw_light_cone(screen, hunter_x, hunter_y))
                 
         # Draw UI elements for Hunter
-        self.draw_battery(self.screen, self.chasseur)
-        self.draw_ghost_detector(self.screen, self.chasseur, self.fantome)
+        dirty.add(self.draw_battery(screen, sim.chasseur))
+        dirty.add(self.draw_ghost_detector(screen, sim.chasseur))
             
         # Draw Ghost only if visible (in light) or for the ghost player
-        if self.fantome.alive:
-            if self.fantome.visible:
-                self.screen.blit(self.ghost_image, (self.fantome.x, self.fantome.y))
+        if sim.fantome.alive:
+            if sim.fantome.visible:
+                sprite = self.ghost_sprite
+                dirty.add(screen.blit(sprite.surface, (ghost_x, ghost_y), sprite.area))
                 # Display ghost health
-                health_text = self.font.render(f"Vie: {int(self.fantome.points_de_vie)}", True, (255, 255, 255))
-                self.screen.blit(health_text, (self.fantome.x, self.fantome.y - 20))
+                health_text = self.text.render(f"Vie: {int(sim.fantome.points_de_vie)}")
+                dirty.add(screen.blit(health_text, (ghost_x, ghost_y - 20)))
                 
             # Ghost is always visible to itself (for ghost player)
-            # In a networked game, you'd only show this to the ghost player
-            pygame.draw.rect(self.screen, (100, 100, 255, 128), 
-                            (self.fantome.x, self.fantome.y, 20, 20), 1)
+            if self.player_id is None or viewer is sim.fantome:
+                dirty.add(pygame.draw.rect(screen, (100, 100, 255, 128), 
+                                           (ghost_x, ghost_y, 20, 20), 1))
                 
         # Draw game over screen if game is over
-        if self.game_over:
+        if sim.game_over:
             self.draw_game_over()
+            dirty.add(screen.get_rect())
+
+        if self.show_profile:
+            dirty.add(self.profile_overlay.draw(screen))
+        self.profiler.lap("draw")
             
-        # Update display
-        pygame.display.flip()
+        # Update display, only the areas that changed when possible
+        rects = dirty.end_frame()
+        if rects is None:
+            pygame.display.flip()
+        else:
+            pygame.display.update(rects)
+        self.profiler.lap("flip")
+        if self.on_ready:
+            self.on_ready()
+            self.on_ready = None
         
     def draw_game_over(self):
-        overlay = pygame.Surface((800, 600), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 180))
-        self.screen.blit(overlay, (0, 0))
+        self.screen.blit(self.overlay, (0, 0))
         
         # Draw game over message
-        game_over_font = pygame.font.Font(None, 72)
-        game_over_text = game_over_font.render("GAME OVER", True, (255, 0, 0))
+        game_over_text = self.text.render("GAME OVER", 72, (255, 0, 0))
         self.screen.blit(game_over_text, 
                         (400 - game_over_text.get_width() // 2, 250 - game_over_text.get_height() // 2))
         
         # Draw winner
-        winner_font = pygame.font.Font(None, 48)
-        winner_text = winner_font.render(f"{self.winner} wins!", True, (255, 255, 255))
+        winner_text = self.text.render(f"{self.sim.winner} wins!", 48)
         self.screen.blit(winner_text, 
                         (400 - winner_text.get_width() // 2, 330 - winner_text.get_height() // 2))
         
-        # Draw restart prompt
-        restart_font = pygame.font.Font(None, 36)
-        restart_text = restart_font.render("Press R to restart or Q to quit", True, (200, 200, 200))
+        # Draw restart prompt, the server restarts networked matches by itself
+        if self.player_id is None:
+            prompt = "Press R to restart or Q to quit"
+        else:
+            seconds = max(0, math.ceil(self.next_match_at - time.monotonic()))
+            prompt = f"Next match in {seconds} s - Press Q to quit"
+        restart_text = self.text.render(prompt, 36, (200, 200, 200))
         self.screen.blit(restart_text, 
                         (400 - restart_text.get_width() // 2, 400 - restart_text.get_height() // 2))
 
+    def read_inputs(self, toggle_lamp):
+        keys = pygame.key.get_pressed()
+        inputs = Inputs(toggle_lamp=toggle_lamp)
+        
+        # Hunter controls
+        if keys[pygame.K_UP]: inputs.hunter_dy = -1
+        if keys[pygame.K_DOWN]: inputs.hunter_dy = 1
+        if keys[pygame.K_LEFT]: inputs.hunter_dx = -1
+        if keys[pygame.K_RIGHT]: inputs.hunter_dx = 1
+        
+        # Ghost controls
+        if keys[pygame.K_w]: inputs.ghost_dy = -1
+        if keys[pygame.K_s]: inputs.ghost_dy = 1
+        if keys[pygame.K_a]: inputs.ghost_dx = -1
+        if keys[pygame.K_d]: inputs.ghost_dx = 1
+        return inputs
+
+    def new_ghost_bot(self):
+        if self.ai_ghost:
+            self.ghost_bot = GhostBot(flow_fields_for(self.sim.level), self.sim.fantome)
+
+    def restart(self):
+        # New match in the same session: only the simulation is reset, the
+        # display, images, baked scene and text caches are reused
+        self.sim.reset()
+        self.new_ghost_bot()
+        self.sight_cell = None
+        self.dirty.invalidate()
+
     def run(self):
-        while not self.game_over:
+        # Session state machine, MATCH -> GAME_OVER -> MATCH ... until QUIT
+        state = MATCH
+        while state != QUIT:
+            if state == MATCH:
+                state = self.play_match()
+            else:
+                state = self.game_over_screen()
+        if self.metrics_file:
+            self.metrics_file.write()
+        pygame.quit()
+
+    def play_match(self):
+        # Fixed-timestep loop: the simulation advances in TICK_MS steps from
+        # an accumulator of real time, and rendering interpolates between the
+        # last two ticks. Slow frames only mean fewer renders, not a slower game.
+        accumulator = 0.0
+        toggle_lamp = False
+        profiler = self.profiler
+        metrics = self.metrics
+        recorder = Recorder(self.sim) if self.record_dir else None
+        self.clock.tick()
+        while not self.sim.game_over:
+            profiler.begin_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    self.game_over = True
-                    pygame.quit()
-                    return
+                    self.save_replay(recorder)
+                    metrics.abandon_match(self.sim)
+                    return QUIT
                     
                 elif event.type == pygame.KEYDOWN:
                     # Toggle flashlight
-                    if event.key == pygame.K_l and pygame.time.get_ticks() - self.derniere_utilisation_lampe > 500:
-                        self.chasseur.lampe_on = not self.chasseur.lampe_on
-                        self.derniere_utilisation_lampe = pygame.time.get_ticks()
-            
-            # Player movement
-            keys = pygame.key.get_pressed()
+                    if event.key == pygame.K_l:
+                        toggle_lamp = True
+                    elif event.key == pygame.K_F3 and profiler.enabled:
+                        self.show_profile = not self.show_profile
+                        self.dirty.invalidate()
+                    elif event.key == pygame.K_F4 and profiler.enabled:
+                        path = profiler.write_trace(f"ghostchase-trace-{int(time.time())}.json")
+                        print(f"Trace written to {path}")
+            profiler.lap("events")
             
-            # Hunter controls
-            hunter_dx, hunter_dy = 0, 0
-            if keys[pygame.K_UP]: hunter_dy = -1
-            if keys[pygame.K_DOWN]: hunter_dy = 1
-            if keys[pygame.K_LEFT]: hunter_dx = -1
-            if keys[pygame.K_RIGHT]: hunter_dx = 1
-            
-            # Apply diagonal movement with normalized speed
-            if hunter_dx != 0 and hunter_dy != 0:
-                hunter_dx *= 0.7071  # 1/sqrt(2)
-                hunter_dy *= 0.7071
-                
-            self.move_player(self.chasseur, hunter_dx, hunter_dy)
+            inputs = self.read_inputs(toggle_lamp)
+            profiler.lap("input")
+            frame_time = self.clock.tick(FRAME_RATE)
+            accumulator += min(frame_time, MAX_FRAME_TIME)
+            profiler.lap("wait")
+            metrics.count("frames")
+            metrics.observe("frame_ms", frame_time)
             
-            # Ghost controls
-            ghost_dx, ghost_dy = 0, 0
-            if keys[pygame.K_w]: ghost_dy = -1
-            if keys[pygame.K_s]: ghost_dy = 1
-            if keys[pygame.K_a]: ghost_dx = -1
-            if keys[pygame.K_d]: ghost_dx = 1
-            
-            # Apply diagonal movement with normalized speed
-            if ghost_dx != 0 and ghost_dy != 0:
-                ghost_dx *= 0.7071
-                ghost_dy *= 0.7071
-                
-            self.move_player(self.fantome, ghost_dx, ghost_dy)
-            
-            # Update game state
-            self.update()
+            # Player movement and game state
+            while accumulator >= TICK_MS and not self.sim.game_over:
+                if self.ghost_bot:
+                    inputs.ghost_dx, inputs.ghost_dy, _ = self.ghost_bot.decide(self.sim)
+                if recorder:
+                    recorder.add(inputs)
+                tick_start = time.perf_counter()
+                self.sim.step(inputs, TICK_MS)
+                metrics.count("ticks")
+                metrics.observe("tick_ms", (time.perf_counter() - tick_start) * 1000)
+                accumulator -= TICK_MS
+                # A key press only applies to one tick
+                inputs.toggle_lamp = toggle_lamp = False
             
             # Draw frame
-            self.draw()
-            
-            # Cap the frame rate
-            self.clock.tick(60)
+            self.draw(min(accumulator / TICK_MS, 1.0))
+            profiler.end_frame()
+            if self.metrics_file:
+                self.metrics_file.poll()
         
-        # Game over loop for restart option
-        restart = False
-        while not restart:
+        self.save_replay(recorder)
+        metrics.end_match(self.sim)
+        if self.on_result:
+            self.on_result(self.sim.winner)
+        return GAME_OVER
+
+    def save_replay(self, recorder):
+        if recorder and len(recorder.replay):
+            print(f"Replay written to {recorder.save(self.record_dir)}")
+
+    def game_over_screen(self):
+        # Wait for R (restart) or Q. Its frames are profiled like the others,
+        # draw() laps would otherwise pile up into the next match's first frame
+        profiler = self.profiler
+        while True:
+            profiler.begin_frame()
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    pygame.quit()
-                    return
+                    return QUIT
                     
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_r:
-                        # Restart game
-                        self.__init__()
-                        self.run()
-                        return
+                        self.restart()
+                        return MATCH
                     elif event.key == pygame.K_q:
-                        pygame.quit()
-                        return
+                        return QUIT
+            profiler.lap("events")
             
             # Draw game over screen
             self.draw()
             self.clock.tick(30)
+            profiler.lap("wait")
+            profiler.end_frame()
 
 if __name__ == "__main__":
     game = Game()
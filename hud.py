@@ -0,0 +1,84 @@
+# hud.py
+from collections import OrderedDict
+import pygame
+from profiler import PHASES, HISTOGRAM_BOUNDS
+
+
+class TextCache:
+    # Rendered text surfaces keyed by (font size, text, color), with LRU
+    # eviction. Fonts are built once per size, so static labels are
+    # rasterized once and changing values (battery %, ghost life) only
+    # when they change.
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, text, size=24, color=(255, 255, 255)):
+        key = (size, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+
+class ProfileOverlay:
+    # Per-phase frame timings of a FrameProfiler: mean / p99 / max in ms and
+    # a histogram of the rolling window. Re-rendered every `refresh` frames.
+    def __init__(self, profiler, text, refresh=30):
+        self.profiler = profiler
+        self.text = text
+        self.refresh = refresh
+        self.surface = None
+        self.rendered_at = 0
+
+    def render(self):
+        font = self.text.font(18)
+        line_height = 16
+        names = PHASES + ("frame",)
+        bucket_count = len(HISTOGRAM_BOUNDS) + 1
+        surface = pygame.Surface((330, line_height * (len(names) + 1) + 8), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 170))
+
+        header_color = (255, 255, 0)
+        surface.blit(font.render("phase (ms)", True, header_color), (4, 4))
+        for column, key in enumerate(("mean", "p99", "max")):
+            label = font.render(key, True, header_color)
+            surface.blit(label, (130 + column * 45 - label.get_width(), 4))
+        surface.blit(font.render("histogram", True, header_color), (230, 4))
+        summary = self.profiler.summary()
+        for row, name in enumerate(names, start=1):
+            y = 4 + row * line_height
+            stats = summary[name]
+            surface.blit(font.render(name, True, (255, 255, 255)), (4, y))
+            for column, key in enumerate(("mean", "p99", "max")):
+                value = font.render(f"{stats[key]:.2f}", True, (255, 255, 255))
+                surface.blit(value, (130 + column * 45 - value.get_width(), y))
+
+            stats = self.profiler.frame if name == "frame" else self.profiler.phases[name]
+            counts = stats.histogram()
+            total = max(1, sum(counts))
+            for bucket in range(bucket_count):
+                height = int(counts[bucket] / total * (line_height - 2))
+                pygame.draw.rect(surface, (0, 200, 255),
+                                 (230 + bucket * 9, y + line_height - 2 - height, 7, max(height, 1)))
+        self.surface = surface
+        self.rendered_at = self.profiler.frames
+
+    def draw(self, screen):
+        if self.surface is None or self.profiler.frames - self.rendered_at >= self.refresh:
+            self.render()
+        return screen.blit(self.surface, (10, screen.get_height() - self.surface.get_height() - 10))
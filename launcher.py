@@ -0,0 +1,125 @@
+# launcher.py
+import multiprocessing
+import traceback
+
+# Runs a game in a process of its own, so pygame owns the main thread of
+# that process and the Tk lobby keeps its own. The process is started ahead
+# of time: it loads pygame and the game (preload) while the player is still
+# in the lobby, then waits for start(). The game reports over a one-way pipe:
+#   ("preloaded",)                   loaded, start() opens the window at once
+#   ("ready",)                       the first frame is on screen
+#   ("result", winner)               a match ended (one per match played)
+#   ("error", message, traceback)    the game raised
+#   ("closed",)                      the window was closed normally
+# A process that ends without "error" or "closed" crashed.
+#
+# Game processes are spawned, not forked: a fork of the lobby would inherit
+# its Tk/X11 state and its threads. preload() already pays for the imports
+# of a fresh interpreter before the player asks for a game.
+CONTEXT = multiprocessing.get_context("spawn")
+
+
+def preload():
+    # Everything a local game needs before its window opens: the modules
+    # (pygame alone is most of the cold start), decoded images, the level
+    # and the AI navigation grid
+    from assets import ASSETS, SPRITES
+    from simulation import Simulation
+    from ai import flow_fields_for
+    import game
+    import client
+    for name in SPRITES:
+        ASSETS.image(name)
+    sim = Simulation()
+    flow_fields_for(sim.level)
+    return sim
+
+
+def game_main(connection, commands):
+    # Entry point of the game process. Waits for ("start", host, port,
+    # room_id, ai_ghost): a local game (against the AI ghost with ai_ghost),
+    # or an online one when a host is given. ("quit",) or the end of the
+    # lobby ends it without playing.
+    def report(winner):
+        connection.send(("result", winner))
+
+    def ready():
+        connection.send(("ready",))
+
+    try:
+        sim = preload()
+        connection.send(("preloaded",))
+        while not commands.poll(1):
+            if not multiprocessing.parent_process().is_alive():
+                return
+        command = commands.recv()
+        if command[0] != "start":
+            return
+        _, host, port, room_id, ai_ghost = command
+        if host is None:
+            from game import Game
+            Game(sim=sim, on_result=report, ai_ghost=ai_ghost, on_ready=ready).run()
+        else:
+            from client import play
+            play(host, port, room_id, on_result=report, on_ready=ready)
+    except Exception as e:
+        connection.send(("error", str(e), traceback.format_exc()))
+    else:
+        connection.send(("closed",))
+    finally:
+        connection.close()
+
+
+class GameProcess:
+    # Lobby side of a game process, polled from the Tk loop. Created in
+    # advance (it preloads), then start() runs the game.
+    def __init__(self):
+        self.connection, child = CONTEXT.Pipe(duplex=False)
+        child_commands, self.commands = CONTEXT.Pipe(duplex=False)
+        self.process = CONTEXT.Process(target=game_main, args=(child, child_commands),
+                                               daemon=True)
+        self.process.start()
+        child.close()  # Only the game holds the sending end, recv sees its exit
+        child_commands.close()
+        self.started = False
+        self.ended = False  # "error" or "closed" received
+
+    def start(self, host=None, port=None, room_id=None, ai_ghost=False):
+        try:
+            self.commands.send(("start", host, port, room_id, ai_ghost))
+        except OSError:
+            pass  # Died while preloading: reported by messages() and crashed()
+        self.started = True
+
+    def messages(self):
+        # Messages received since the last call, never blocks
+        received = []
+        try:
+            while self.connection.poll():
+                message = self.connection.recv()
+                self.ended = self.ended or message[0] in ("error", "closed")
+                received.append(message)
+        except (EOFError, OSError):
+            pass
+        return received
+
+    def running(self):
+        return self.process.is_alive()
+
+    def crashed(self):
+        # Only meaningful once the process is gone
+        return not self.ended
+
+    @property
+    def exitcode(self):
+        return self.process.exitcode
+
+    def close(self):
+        if not self.started:
+            try:
+                self.commands.send(("quit",))
+            except OSError:
+                pass
+        self.process.join(1)
+        self.commands.close()
+        self.connection.close()
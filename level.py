@@ -0,0 +1,214 @@
+# level.py
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import numpy as np
+
+LEVELS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "levels")
+DEFAULT_LEVEL = "manoir"
+BODY_SIZE = 20  # Size of a player body, used for the walkable grid
+
+# Compiled level (.gcl) layout, little endian:
+#   header (HEADER)
+#   walls          int32[n_walls, 4]        x, y, width, height
+#   occupancy      uint8[rows, cols]        1 if a body fits at the cell origin
+#   hunter spawns  int32[n_hunters, 2]      pixel positions
+#   ghost spawns   int32[n_ghosts, 2]       pixel positions
+#   battery cells  int32[n_batteries]       walkable cell indices (row * cols + col)
+# Every section starts on a 4 byte boundary so it can be viewed in place.
+MAGIC = b"GCLV"
+VERSION = 1
+HEADER = struct.Struct("<4sHHIIIIIIIII")
+
+
+class Level:
+    def __init__(self, name, width, height, cell_size, walls, occupancy,
+                 hunter_spawns, ghost_spawns, battery_cells, buffer=None):
+        self.name = name
+        self.source = name  # Argument of load_level, set when loaded from a file
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.walls = walls
+        self.occupancy = occupancy
+        self.hunter_spawns = hunter_spawns
+        self.ghost_spawns = ghost_spawns
+        self.battery_cells = battery_cells
+        self.buffer = buffer  # Keeps the memory map alive for the array views
+        self.flow_fields = None  # ai.flow_fields_for, built by the first bot
+
+    @property
+    def cols(self):
+        return self.occupancy.shape[1]
+
+    @property
+    def rows(self):
+        return self.occupancy.shape[0]
+
+    def cell_position(self, cell):
+        # Pixel position of a cell origin
+        row, col = divmod(int(cell), self.cols)
+        return col * self.cell_size, row * self.cell_size
+
+
+def walkable_grid(walls, width, height, cell_size, body_size=BODY_SIZE):
+    # Cell (row, col) is walkable when a body placed at its origin stays
+    # inside the map and overlaps no wall
+    cols = width // cell_size
+    rows = height // cell_size
+    occupancy = np.ones((rows, cols), dtype=np.uint8)
+    occupancy[:, max(0, (width - body_size) // cell_size + 1):] = 0
+    occupancy[max(0, (height - body_size) // cell_size + 1):, :] = 0
+    for x, y, wall_width, wall_height in walls:
+        # Cells with col * cell_size < x + wall_width and col * cell_size + body_size > x
+        col_min = max(0, (x - body_size) // cell_size + 1)
+        col_max = -(-(x + wall_width) // cell_size)
+        row_min = max(0, (y - body_size) // cell_size + 1)
+        row_max = -(-(y + wall_height) // cell_size)
+        occupancy[row_min:row_max, col_min:col_max] = 0
+    return occupancy
+
+
+def parse_level(path):
+    # Build a level from its human-editable JSON source
+    with open(path, encoding="utf-8") as f:
+        source = json.load(f)
+
+    name = source.get("name", os.path.splitext(os.path.basename(path))[0])
+    width = int(source["width"])
+    height = int(source["height"])
+    cell_size = int(source.get("cell_size", 10))
+    walls = np.array(source["walls"], dtype=np.int32).reshape(-1, 4)
+    occupancy = walkable_grid(walls.tolist(), width, height, cell_size)
+
+    def spawn_points(kind):
+        points = np.array(source["spawns"][kind], dtype=np.int32).reshape(-1, 2)
+        if not len(points):
+            raise ValueError(f"{path}: no spawn point for {kind}")
+        for x, y in points.tolist():
+            if x % cell_size or y % cell_size or not occupancy[y // cell_size, x // cell_size]:
+                raise ValueError(f"{path}: spawn point {kind} ({x}, {y}) is not on a walkable cell")
+        return points
+
+    hunter_spawns = spawn_points("chasseur")
+    ghost_spawns = spawn_points("fantome")
+
+    # Walkable cells whose origin lies inside the battery zone
+    x_min, y_min, x_max, y_max = source.get("battery_zone", (0, 0, width, height))
+    rows, cols = occupancy.shape
+    xs = np.arange(cols) * cell_size
+    ys = np.arange(rows) * cell_size
+    zone = np.outer((ys >= y_min) & (ys <= y_max), (xs >= x_min) & (xs <= x_max))
+    battery_cells = np.flatnonzero(zone & (occupancy == 1)).astype(np.int32)
+
+    return Level(name, width, height, cell_size, walls, occupancy,
+                 hunter_spawns, ghost_spawns, battery_cells)
+
+
+def write_compiled(level, path):
+    name = level.name.encode("utf-8")
+    header = HEADER.pack(MAGIC, VERSION, level.cell_size, level.width, level.height,
+                         level.cols, level.rows, len(level.walls), len(level.hunter_spawns),
+                         len(level.ghost_spawns), len(level.battery_cells), len(name))
+    sections = [
+        np.ascontiguousarray(level.walls, dtype="<i4").tobytes(),
+        np.ascontiguousarray(level.occupancy, dtype=np.uint8).tobytes(),
+        np.ascontiguousarray(level.hunter_spawns, dtype="<i4").tobytes(),
+        np.ascontiguousarray(level.ghost_spawns, dtype="<i4").tobytes(),
+        np.ascontiguousarray(level.battery_cells, dtype="<i4").tobytes(),
+        name,
+    ]
+    # Own temporary file: game processes and workers starting together may
+    # all rebuild the same stale level, each replace publishes a whole file
+    with tempfile.NamedTemporaryFile("wb", dir=os.path.dirname(os.path.abspath(path)),
+                                     prefix=os.path.basename(path) + ".", suffix=".tmp",
+                                     delete=False) as f:
+        try:
+            f.write(header)
+            for section in sections:
+                f.write(section)
+                f.write(b"\0" * (-len(section) % 4))
+        except OSError:
+            f.close()
+            os.remove(f.name)
+            raise
+    os.replace(f.name, path)
+
+
+def is_current(path):
+    # True when path is a compiled level of this format version
+    try:
+        with open(path, "rb") as f:
+            magic, version = HEADER.unpack_from(f.read(HEADER.size))[:2]
+    except (OSError, struct.error):
+        return False
+    return magic == MAGIC and version == VERSION
+
+
+def read_compiled(path):
+    # Memory-map a compiled level; the arrays are read-only views of the file
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    (magic, version, cell_size, width, height, cols, rows, n_walls, n_hunters,
+     n_ghosts, n_batteries, name_length) = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path}: not a compiled level (version {VERSION})")
+
+    offset = HEADER.size
+
+    def view(dtype, count, shape):
+        nonlocal offset
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=offset).reshape(shape)
+        offset += array.nbytes + (-array.nbytes % 4)
+        return array
+
+    walls = view("<i4", n_walls * 4, (n_walls, 4))
+    occupancy = view(np.uint8, rows * cols, (rows, cols))
+    hunter_spawns = view("<i4", n_hunters * 2, (n_hunters, 2))
+    ghost_spawns = view("<i4", n_ghosts * 2, (n_ghosts, 2))
+    battery_cells = view("<i4", n_batteries, (n_batteries,))
+    name = bytes(buffer[offset:offset + name_length]).decode("utf-8")
+
+    return Level(name, width, height, cell_size, walls, occupancy,
+                 hunter_spawns, ghost_spawns, battery_cells, buffer)
+
+
+def compile_level(source_path, compiled_path=None):
+    if compiled_path is None:
+        compiled_path = os.path.splitext(source_path)[0] + ".gcl"
+    write_compiled(parse_level(source_path), compiled_path)
+    return compiled_path
+
+
+def load_level(name=DEFAULT_LEVEL):
+    # Accepts a level name from levels/ or a path to a .json or .gcl file.
+    # The compiled form is rebuilt when the source is newer or when it was
+    # written by another version of the format.
+    base = name if os.path.dirname(name) else os.path.join(LEVELS_DIR, name)
+    base = os.path.splitext(base)[0]
+    source_path = base + ".json"
+    compiled_path = base + ".gcl"
+
+    level = None
+    if os.path.exists(source_path):
+        if (not is_current(compiled_path) or
+                os.path.getmtime(compiled_path) < os.path.getmtime(source_path)):
+            try:
+                compile_level(source_path, compiled_path)
+            except OSError:
+                # Read-only install: use the source directly
+                level = parse_level(source_path)
+    if level is None:
+        level = read_compiled(compiled_path)
+    level.source = name  # Loads it again (replays)
+    return level
+
+
+if __name__ == "__main__":
+    # python level.py levels/*.json
+    for source_path in sys.argv[1:]:
+        print(compile_level(source_path))
@@ -0,0 +1,52 @@
+# lighting.py
+import math
+import pygame
+from simulation import LIGHT_RADIUS, LIGHT_ANGLE, PLAYER_SIZE, facing_angle
+
+LIGHT_COLOR = (255, 255, 150, 100)  # Added transparency
+ARC_POINTS = 21  # More points for smoother cone
+
+
+def cone_points(angle, radius=LIGHT_RADIUS, light_angle=LIGHT_ANGLE):
+    # Light cone polygon, relative to the light origin
+    half_angle_rad = math.radians(light_angle / 2)
+    step = 2 * half_angle_rad / (ARC_POINTS - 1)
+    points = [(0.0, 0.0)]
+    for i in range(ARC_POINTS):
+        angle_i = angle - half_angle_rad + i * step
+        points.append((radius * math.cos(angle_i), radius * math.sin(angle_i)))
+    return points
+
+
+class LightRenderer:
+    # The hunter only ever faces one of 8 key-driven directions, so each cone
+    # is rasterized once into an alpha surface no larger than its bounding
+    # rect. Drawing is then a single blit limited to that rect.
+    def __init__(self):
+        self.cones = {}
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                self.cone(facing_angle(dx, dy))
+
+    def cone(self, angle):
+        key = round(angle, 4)
+        cone = self.cones.get(key)
+        if cone is None:
+            points = cone_points(angle)
+            min_x = math.floor(min(x for x, _ in points))
+            min_y = math.floor(min(y for _, y in points))
+            width = math.ceil(max(x for x, _ in points)) - min_x + 1
+            height = math.ceil(max(y for _, y in points)) - min_y + 1
+
+            surface = pygame.Surface((width, height), pygame.SRCALPHA)
+            pygame.draw.polygon(surface, LIGHT_COLOR, [(x - min_x, y - min_y) for x, y in points])
+            cone = (surface, min_x, min_y)
+            self.cones[key] = cone
+        return cone
+
+    def draw(self, screen, x, y, angle):
+        # Draws the light of a player at (x, y), returns the screen rect touched
+        surface, offset_x, offset_y = self.cone(angle)
+        half_size = PLAYER_SIZE // 2
+        return screen.blit(surface, (int(x) + half_size + offset_x,
+                                     int(y) + half_size + offset_y))
@@ -0,0 +1,297 @@
+# match_host.py
+import argparse
+import asyncio
+import itertools
+import multiprocessing
+import os
+import time
+from level import DEFAULT_LEVEL
+from simulation import TICK_MS, TICK_RATE
+from server import GameServer
+from metrics import MetricsFile, memory_bytes, render_text, serve_metrics
+import protocol
+
+STATUS_EVERY = 0.5  # Seconds between two worker status reports
+POLL_EVERY = 0.05  # Seconds between two reads of the worker pipes
+
+
+# Match host: one GameServer per worker process, each on its own UDP port
+# (base port + 1 + worker index) and hosting as many rooms as it can tick.
+# The host process listens on the base port as a directory: it answers LIST
+# with the rooms of every worker and REDIRECTs a HELLO to the worker that
+# owns the room, or to the least loaded one for a new room. Room ids are
+# allocated per worker as index + 1 + k * workers, so the owner of a room
+# is known from its id alone.
+
+
+def worker_main(index, workers, host, port, level_name, connection, fill_bots=0, record=None):
+    # Entry point of a worker process. Commands from the host arrive on
+    # `connection`: ("bots", rooms) replaces the bot rooms, ("reset",)
+    # restarts the tick statistics, ("stop",) ends the worker.
+    server = GameServer(level_name, room_ids=itertools.count(index + 1, workers), fill_bots=fill_bots,
+                        record=record)
+
+    async def pump():
+        next_status = 0.0
+        while server.running:
+            while connection.poll():
+                command = connection.recv()
+                if command[0] == "bots":
+                    server.set_bot_rooms(command[1])
+                elif command[0] == "reset":
+                    server.reset_stats()
+                elif command[0] == "stop":
+                    server.running = False
+            now = time.monotonic()
+            if now >= next_status:
+                connection.send(("status", index, server.room_list(), server.stats(),
+                                 server.metrics_snapshot()))
+                next_status = now + STATUS_EVERY
+            await asyncio.sleep(POLL_EVERY)
+
+    async def main():
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=(host, port))
+        pumping = asyncio.ensure_future(pump())
+        try:
+            await server.run()
+        finally:
+            pumping.cancel()
+            transport.close()
+
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+class Worker:
+    # Host side of a worker process, with its last status report
+    def __init__(self, index, workers, host, port, level_name, fill_bots=0, record=None):
+        self.index = index
+        self.port = port
+        self.connection, child = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(
+            target=worker_main, args=(index, workers, host, port, level_name, child, fill_bots, record),
+            daemon=True)
+        self.rooms = []
+        self.stats = None
+        self.metrics = None  # GameServer.metrics_snapshot()
+        self.reported_at = None
+        self.pending = 0  # Clients redirected here since the last report
+
+    def start(self):
+        self.process.start()
+
+    def send(self, *command):
+        self.connection.send(command)
+
+    def poll(self):
+        while self.connection.poll():
+            _, _, self.rooms, self.stats, self.metrics = self.connection.recv()
+            self.reported_at = time.monotonic()
+            self.pending = 0
+
+    def stop(self):
+        if self.process.is_alive():
+            self.send("stop")
+            self.process.join(2)
+        if self.process.is_alive():
+            self.process.terminate()
+
+
+class MatchHost(asyncio.DatagramProtocol):
+    def __init__(self, host="0.0.0.0", port=5656, workers=None, level_name=DEFAULT_LEVEL, fill_bots=0,
+                 record=None):
+        count = workers or os.cpu_count() or 1
+        self.workers = [Worker(i, count, host, port + 1 + i, level_name, fill_bots, record)
+                        for i in range(count)]
+        self.waiting = None  # Worker the last unpaired client was sent to
+        self.transport = None
+
+    def start(self):
+        for worker in self.workers:
+            worker.start()
+
+    def stop(self):
+        for worker in self.workers:
+            worker.stop()
+
+    def poll(self):
+        for worker in self.workers:
+            worker.poll()
+
+    async def wait_ready(self, timeout=10.0):
+        deadline = time.monotonic() + timeout
+        while any(worker.stats is None for worker in self.workers):
+            if time.monotonic() > deadline:
+                raise RuntimeError("match host workers did not start")
+            await asyncio.sleep(POLL_EVERY)
+            self.poll()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def room_list(self):
+        return [room for worker in self.workers for room in worker.rooms]
+
+    def worker_for(self, room_id):
+        if room_id not in (protocol.ANY_ROOM, protocol.NEW_ROOM):
+            return self.workers[(room_id - 1) % len(self.workers)]
+        if room_id == protocol.ANY_ROOM:
+            # Pair with the client redirected just before, or with someone
+            # waiting for an opponent as of the last reports
+            if self.waiting is not None:
+                worker, self.waiting = self.waiting, None
+                return worker
+            for worker in self.workers:
+                if any(players in (1, 2) for _, _, players, _ in worker.rooms):
+                    return worker
+        worker = min(self.workers, key=lambda worker: len(worker.rooms) + worker.pending)
+        worker.pending += 1
+        if room_id == protocol.ANY_ROOM:
+            self.waiting = worker
+        return worker
+
+    def datagram_received(self, data, address):
+        kind = protocol.packet_type(data)
+        if kind == protocol.LIST:
+            self.transport.sendto(protocol.encode_rooms(self.room_list(), protocol.decode_list(data)),
+                                  address)
+        elif kind == protocol.HELLO:
+            _, room_id = protocol.decode_hello(data)
+            self.transport.sendto(protocol.encode_redirect(self.worker_for(room_id).port), address)
+
+    async def run(self, report_every=0, metrics_file=None):
+        last_report = time.monotonic()
+        dump = MetricsFile(metrics_file, self.metrics_text) if metrics_file else None
+        while True:
+            await asyncio.sleep(POLL_EVERY)
+            self.poll()
+            if dump:
+                dump.poll()
+            if report_every and time.monotonic() - last_report >= report_every:
+                last_report = time.monotonic()
+                print(self.report())
+
+    def metrics_text(self):
+        # The whole host (rooms, clients and memory of every process), then
+        # each worker's own metrics as of its last report
+        reported = [worker for worker in self.workers if worker.metrics is not None]
+        host = {
+            "counters": {},
+            "gauges": {
+                "workers": len(self.workers),
+                "rooms": sum(worker.metrics["gauges"]["rooms"] for worker in reported),
+                "clients": sum(worker.metrics["gauges"]["clients"] for worker in reported),
+                "memory_bytes": memory_bytes() + sum(worker.metrics["gauges"]["memory_bytes"]
+                                                     for worker in reported),
+            },
+            "distributions": {},
+        }
+        return render_text(host) + "".join(render_text(worker.metrics, {"worker": worker.index})
+                                           for worker in reported)
+
+    def report(self):
+        lines = []
+        for worker in self.workers:
+            stats = worker.stats
+            if stats is None:
+                continue
+            lines.append(f"worker {worker.index} port {worker.port}: {stats['matches']} matches, "
+                         f"{stats['clients']} clients, {stats['tick_rate']:.1f} ticks/s, "
+                         f"tick p99 {stats['tick_ms']['p99']:.3f} ms")
+        return "\n".join(lines)
+
+    async def measure(self, rooms_per_worker, warmup=2.0, duration=5.0):
+        # Load every worker with bot rooms and return their statistics
+        for worker in self.workers:
+            worker.send("bots", rooms_per_worker)
+        await asyncio.sleep(warmup)
+        for worker in self.workers:
+            worker.send("reset")
+        await asyncio.sleep(duration + STATUS_EVERY)
+        self.poll()
+        return [worker.stats for worker in self.workers]
+
+    async def capacity(self, start=8, warmup=2.0, duration=5.0):
+        # Double the bot rooms per worker until a worker misses its tick
+        # rate or its p99 tick time exceeds the tick period; the answer is
+        # the last load every worker sustained
+        results = []
+        rooms = start
+        while True:
+            stats = await self.measure(rooms, warmup, duration)
+            tick_rate = min(worker["tick_rate"] for worker in stats)
+            p99 = max(worker["tick_ms"]["p99"] for worker in stats)
+            sustained = tick_rate >= TICK_RATE * 0.98 and p99 <= TICK_MS
+            results.append({"matches": rooms * len(self.workers), "rooms_per_worker": rooms,
+                            "min_tick_rate": tick_rate, "max_tick_p99_ms": p99,
+                            "sustained": sustained})
+            print(f"{rooms * len(self.workers):6d} matches ({rooms} per worker): "
+                  f"{tick_rate:6.1f} ticks/s, tick p99 {p99:.3f} ms"
+                  f"{'' if sustained else '  <- overloaded'}")
+            if not sustained:
+                break
+            rooms *= 2
+        for worker in self.workers:
+            worker.send("bots", 0)
+        return results
+
+
+async def host(args):
+    match_host = MatchHost(args.host, args.port, args.workers, args.level, args.fill_bots, args.record)
+    match_host.start()
+    try:
+        await match_host.wait_ready()
+        if args.capacity:
+            results = await match_host.capacity(args.capacity)
+            sustained = [result["matches"] for result in results if result["sustained"]]
+            print(f"{len(match_host.workers)} workers sustain {max(sustained, default=0)} "
+                  f"concurrent matches at {TICK_RATE} Hz")
+            return
+        loop = asyncio.get_running_loop()
+        transport, _ = await loop.create_datagram_endpoint(lambda: match_host,
+                                                           local_addr=(args.host, args.port))
+        print(f"Ghost Chase match host on {args.host}:{args.port}, "
+              f"{len(match_host.workers)} workers on ports {args.port + 1}-{args.port + len(match_host.workers)}")
+        endpoint = None
+        if args.metrics_port:
+            endpoint = await serve_metrics(match_host.metrics_text, port=args.metrics_port)
+            print(f"Metrics on http://127.0.0.1:{args.metrics_port}/metrics")
+        try:
+            await match_host.run(args.report, args.metrics_file)
+        finally:
+            if endpoint:
+                endpoint.close()
+            transport.close()
+    finally:
+        match_host.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghost Chase match host (many rooms, one process per core)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5656)
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per core)")
+    parser.add_argument("--level", default=DEFAULT_LEVEL)
+    parser.add_argument("--report", type=float, default=0, metavar="SECONDS",
+                        help="print worker statistics periodically")
+    parser.add_argument("--fill-bots", type=float, default=0, metavar="SECONDS",
+                        help="seat an AI opponent after a client waited this long alone")
+    parser.add_argument("--record", metavar="DIR", help="save every match as a replay (replay.py)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve metrics as text on http://127.0.0.1:PORT/")
+    parser.add_argument("--metrics-file", metavar="FILE", help="write metrics to FILE every 10 seconds")
+    parser.add_argument("--capacity", type=int, nargs="?", const=8, metavar="ROOMS",
+                        help="measure how many bot matches the workers sustain, "
+                             "starting from ROOMS per worker and doubling")
+    args = parser.parse_args()
+    try:
+        asyncio.run(host(args))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,196 @@
+# metrics.py
+import asyncio
+import os
+import time
+from profiler import RollingStats
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+PREFIX = "ghostchase"
+WINDOW = 1024  # Recent samples kept per distribution
+DUMP_EVERY = 10.0  # Seconds between two writes of a metrics file
+
+# Everything that can be recorded, created up front: recording is then a
+# dict update or a ring buffer write, nothing is allocated while playing
+COUNTERS = (
+    "ticks",             # Simulation ticks run
+    "frames",            # Frames rendered (Game)
+    "matches",           # Matches played to the end
+    "matches_abandoned", # Matches left before the end
+    "hunter_wins",
+    "ghost_wins",
+    "lamp_uses",         # Times a lamp was switched on
+    "lamp_seconds",      # Time lamps were lit
+    "battery_pickups",
+)
+GAUGES = (
+    "rooms",             # Active rooms (server)
+    "clients",           # Connected clients (server)
+    "memory_bytes",      # Resident memory of the process
+    "uptime_seconds",
+)
+DISTRIBUTIONS = (
+    "tick_ms",           # Time to run one tick
+    "frame_ms",          # Time between two frames (Game)
+    "match_seconds",     # Length of the matches played to the end
+)
+QUANTILES = (("0.5", "p50"), ("0.99", "p99"), ("1", "max"))
+
+
+def memory_bytes():
+    # Current resident memory, or the peak where only that is available
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return 0
+
+
+class Metrics:
+    # Operational numbers of a process: counters, gauges and the last
+    # WINDOW samples of each distribution in preallocated ring buffers.
+    # snapshot() is a plain dict (sent over worker pipes), render_text()
+    # turns one into the text exposition served or dumped.
+    enabled = True
+
+    def __init__(self, window=WINDOW):
+        self.counters = dict.fromkeys(COUNTERS, 0)
+        self.gauges = dict.fromkeys(GAUGES, 0)
+        self.distributions = {name: RollingStats(window) for name in DISTRIBUTIONS}
+        self.observed = dict.fromkeys(DISTRIBUTIONS, 0)  # Samples ever added
+        self.started = time.monotonic()
+
+    def count(self, name, amount=1):
+        self.counters[name] += amount
+
+    def set(self, name, value):
+        self.gauges[name] = value
+
+    def observe(self, name, value):
+        self.distributions[name].add(value)
+        self.observed[name] += 1
+
+    def end_match(self, sim):
+        # Telemetry of a match that just ended, tallied by its entities
+        self.count("matches")
+        if sim.winner == "Chasseur":
+            self.count("hunter_wins")
+        elif sim.winner is not None:
+            self.count("ghost_wins")
+        self.count_entities(sim)
+        self.observe("match_seconds", sim.time / 1000)
+
+    def abandon_match(self, sim):
+        # A match left before the end: no winner nor length, but what was
+        # played counts, or the totals would only describe finished matches
+        self.count("matches_abandoned")
+        self.count_entities(sim)
+
+    def count_entities(self, sim):
+        for hunter in sim.hunters:
+            self.count("lamp_uses", hunter.lamp_uses)
+            self.count("lamp_seconds", hunter.lamp_time / 1000)
+            self.count("battery_pickups", hunter.pickups)
+
+    def snapshot(self):
+        self.set("memory_bytes", memory_bytes())
+        self.set("uptime_seconds", time.monotonic() - self.started)
+        return {
+            "counters": dict(self.counters),
+            "gauges": dict(self.gauges),
+            "distributions": {name: dict(stats.summary(), count=self.observed[name])
+                              for name, stats in self.distributions.items()},
+        }
+
+    def text(self):
+        return render_text(self.snapshot())
+
+
+class NullMetrics:
+    # Stand-in when metrics are off, every call is a no-op
+    enabled = False
+
+    def count(self, name, amount=1):
+        pass
+
+    def set(self, name, value):
+        pass
+
+    def observe(self, name, value):
+        pass
+
+    def end_match(self, sim):
+        pass
+
+    def abandon_match(self, sim):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def render_text(snapshot, labels=None):
+    # Prometheus text format (untyped), one line per value:
+    #   ghostchase_matches_total{worker="0"} 12
+    #   ghostchase_tick_ms{quantile="0.99"} 0.8
+    def line(name, value, extra=None):
+        pairs = dict(labels or {}, **(extra or {}))
+        label_text = ",".join(f'{key}="{label}"' for key, label in pairs.items())
+        value = value if isinstance(value, int) else round(value, 6)
+        return f"{PREFIX}_{name}{{{label_text}}} {value}" if pairs else f"{PREFIX}_{name} {value}"
+
+    lines = [line(f"{name}_total", value) for name, value in snapshot["counters"].items()]
+    lines += [line(name, value) for name, value in snapshot["gauges"].items()]
+    for name, stats in snapshot["distributions"].items():
+        lines += [line(name, stats[key], {"quantile": quantile}) for quantile, key in QUANTILES]
+        lines.append(line(f"{name}_mean", stats["mean"]))
+        lines.append(line(f"{name}_count", stats["count"]))
+    return "\n".join(lines) + "\n"
+
+
+class MetricsFile:
+    # Writes render() to `path` every `every` seconds when poll()ed (and on
+    # write()), atomically so a collector never reads half a file
+    def __init__(self, path, render, every=DUMP_EVERY):
+        self.path = path
+        self.render = render
+        self.every = every
+        self.next_write = time.monotonic() + every
+
+    def poll(self):
+        now = time.monotonic()
+        if now >= self.next_write:
+            self.next_write = now + self.every
+            self.write()
+
+    def write(self):
+        temporary = self.path + ".tmp"
+        try:
+            with open(temporary, "w") as f:
+                f.write(self.render())
+            os.replace(temporary, self.path)
+        except OSError as e:
+            print(f"Error writing metrics to {self.path}: {e}")
+
+
+async def serve_metrics(render, host="127.0.0.1", port=9656):
+    # Local HTTP endpoint: any GET answers render() as text
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b"\r\n\r\n")
+            body = render().encode()
+            writer.write(b"HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                         b"Content-Length: %d\r\n\r\n" % len(body) + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    return await asyncio.start_server(handle, host, port)
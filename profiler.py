@@ -0,0 +1,115 @@
+# profiler.py
+import json
+import os
+import time
+from array import array
+from collections import deque
+
+# Phases of a frame of Game.run, in order
+PHASES = ("events", "input", "wait", "broad_phase", "move_player", "update", "draw", "flip")
+# Upper bounds of the histogram buckets, in ms (last bucket is everything above)
+HISTOGRAM_BOUNDS = (0.05, 0.1, 0.25, 0.5, 1, 2, 4, 8, 16)
+
+
+class RollingStats:
+    # Last `window` samples (ms) in a preallocated ring buffer
+    def __init__(self, window):
+        self.samples = array('d', [0.0]) * window
+        self.index = 0
+        self.count = 0
+
+    def add(self, value):
+        self.samples[self.index] = value
+        self.index = (self.index + 1) % len(self.samples)
+        self.count = min(self.count + 1, len(self.samples))
+
+    def values(self):
+        return self.samples[:self.count]
+
+    def summary(self):
+        values = sorted(self.values())
+        if not values:
+            return {"mean": 0.0, "p50": 0.0, "p99": 0.0, "max": 0.0}
+        return {
+            "mean": sum(values) / len(values),
+            "p50": values[len(values) // 2],
+            "p99": values[min(len(values) - 1, int(len(values) * 0.99))],
+            "max": values[-1],
+        }
+
+    def histogram(self):
+        counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        for value in self.values():
+            bucket = 0
+            while bucket < len(HISTOGRAM_BOUNDS) and value > HISTOGRAM_BOUNDS[bucket]:
+                bucket += 1
+            counts[bucket] += 1
+        return counts
+
+
+class FrameProfiler:
+    # Times each phase of every frame. Phases are consecutive: lap(phase)
+    # charges the time since the previous lap to `phase`, so instrumenting
+    # costs one clock read per phase. A phase can be lapped several times
+    # per frame (one simulation tick each), the frame total is kept.
+    enabled = True
+
+    def __init__(self, window=240, trace_events=200000):
+        self.phases = {phase: RollingStats(window) for phase in PHASES}
+        self.frame = RollingStats(window)
+        self.current = dict.fromkeys(PHASES, 0)
+        self.frames = 0
+        # (name, start ns, duration ns) for the trace file, oldest dropped first
+        self.trace = deque(maxlen=trace_events)
+        self.origin = time.perf_counter_ns()
+        self.frame_start = self.last = self.origin
+
+    def begin_frame(self):
+        self.frame_start = self.last = time.perf_counter_ns()
+
+    def lap(self, phase):
+        now = time.perf_counter_ns()
+        self.current[phase] += now - self.last
+        self.trace.append((phase, self.last, now - self.last))
+        self.last = now
+
+    def end_frame(self):
+        for phase, elapsed in self.current.items():
+            self.phases[phase].add(elapsed / 1e6)
+            self.current[phase] = 0
+        self.frame.add((self.last - self.frame_start) / 1e6)
+        self.trace.append(("frame", self.frame_start, self.last - self.frame_start))
+        self.frames += 1
+
+    def summary(self):
+        stats = {phase: self.phases[phase].summary() for phase in PHASES}
+        stats["frame"] = self.frame.summary()
+        return stats
+
+    def write_trace(self, path):
+        # Chrome trace event format, opens in chrome://tracing or Perfetto
+        pid = os.getpid()
+        events = [{"name": name, "cat": "frame", "ph": "X", "pid": pid,
+                   "tid": 0 if name == "frame" else 1,
+                   "ts": (start - self.origin) / 1000, "dur": duration / 1000}
+                  for name, start, duration in self.trace]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        return path
+
+
+class NullProfiler:
+    # Stand-in when profiling is off, every call is a no-op
+    enabled = False
+
+    def begin_frame(self):
+        pass
+
+    def lap(self, phase):
+        pass
+
+    def end_frame(self):
+        pass
+
+
+NULL_PROFILER = NullProfiler()
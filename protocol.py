@@ -0,0 +1,282 @@
+# protocol.py
+import math
+import struct
+from entities import BatteryRecharge
+
+# Compact binary protocol between server.py and client.py (UDP datagrams).
+#
+# client -> server
+#   HELLO     type, version, room id (ANY_ROOM pairs with whoever is
+#             waiting, NEW_ROOM opens a room)
+#   INPUT     type, acked snapshot tick, first input sequence, count, inputs
+#             (one byte each, the last unacknowledged inputs are resent in
+#             every packet so a lost datagram does not lose input)
+#   LIST      type, offset of the first room wanted
+#   BYE       type
+# server -> client
+#   WELCOME   type, version, player id, ticks per snapshot, room id, level name
+#   SNAPSHOT  type, tick, baseline tick, last input sequence applied,
+#             changed field mask, zigzag varint deltas of the changed fields
+#             against the baseline view, then the batteries if they changed
+#   ROOMS     type, room count, offset, entries (room id, UDP port of the
+#             process hosting it, seated players mask, finished flag)
+#   REDIRECT  type, port: say HELLO again to that port (match_host.py)
+#   REFUSED   type, reason
+#
+# A view is what one player is allowed to know about the match: hunters
+# only get the ghost position while it is in the light (interest management)
+# and get the detector distance from the server instead; the ghost only gets
+# the hunter and the batteries in its line of sight (fog of war).
+
+VERSION = 3
+HELLO, WELCOME, INPUT, SNAPSHOT, BYE, LIST, ROOMS, REDIRECT, REFUSED = range(1, 10)
+SPECTATOR, HUNTER, GHOST = 0, 1, 2  # Player ids, same as Simulation.players
+ANY_ROOM, NEW_ROOM = 0, 0xFFFFFFFF
+ROOM_FULL, NO_SUCH_ROOM, BAD_VERSION = 1, 2, 3  # REFUSED reasons
+REFUSED_REASONS = {ROOM_FULL: "room is full", NO_SUCH_ROOM: "no such room",
+                   BAD_VERSION: "protocol version mismatch"}
+
+NO_BASELINE = 0xFFFFFFFF
+RESTART_DELAY = 5.0  # Seconds a finished match stays on screen before the next one
+POSITION_SCALE = 8  # Positions are sent in 1/8 px
+
+# View fields
+(HUNTER_X, HUNTER_Y, HUNTER_FLAGS, BATTERY, FACING, GHOST_X, GHOST_Y,
+ GHOST_FLAGS, GHOST_LIFE, DETECTOR, MATCH) = range(11)
+FIELD_COUNT = 11
+BATTERIES_CHANGED = 1 << 15
+ALIVE, LAMP_ON, SEEN = 1, 2, 4  # Hunter flags
+LIT, KNOWN = 2, 4  # Ghost flags (with ALIVE)
+EMPTY_VIEW = ((0,) * FIELD_COUNT, ())
+
+HEADER = struct.Struct("<B")
+HELLO_PACKET = struct.Struct("<BBI")
+WELCOME_PACKET = struct.Struct("<BBBBI")
+LIST_PACKET = struct.Struct("<BH")
+ROOMS_PACKET = struct.Struct("<BHHB")
+ROOM_ENTRY = struct.Struct("<IHBB")
+ROOMS_PER_PACKET = 150  # Keeps ROOMS datagrams under 1300 bytes
+PORT_PACKET = struct.Struct("<BH")
+INPUT_PACKET = struct.Struct("<BIIB")
+SNAPSHOT_PACKET = struct.Struct("<BIIIH")
+BATTERY_POSITION = struct.Struct("<HH")
+
+
+def packet_type(data):
+    return data[0] if data else None
+
+
+def pack_input(dx, dy, toggle_lamp):
+    return (dx + 1) | (dy + 1) << 2 | bool(toggle_lamp) << 4
+
+
+def unpack_input(value):
+    return (value & 3) - 1, (value >> 2 & 3) - 1, bool(value & 16)
+
+
+def encode_hello(room_id=ANY_ROOM):
+    return HELLO_PACKET.pack(HELLO, VERSION, room_id)
+
+
+def decode_hello(data):
+    # (version, room id); older clients send no room
+    if len(data) < HELLO_PACKET.size:
+        return (data[1] if len(data) > 1 else 0), ANY_ROOM
+    return HELLO_PACKET.unpack_from(data)[1:]
+
+
+def encode_welcome(player_id, snapshot_every, room_id, level_name):
+    return (WELCOME_PACKET.pack(WELCOME, VERSION, player_id, snapshot_every, room_id)
+            + level_name.encode("utf-8"))
+
+
+def decode_welcome(data):
+    _, version, player_id, snapshot_every, room_id = WELCOME_PACKET.unpack_from(data)
+    if version != VERSION:
+        raise ValueError(f"server speaks protocol {version}, expected {VERSION}")
+    return player_id, snapshot_every, room_id, data[WELCOME_PACKET.size:].decode("utf-8")
+
+
+def encode_input(acked_tick, first_seq, inputs):
+    return INPUT_PACKET.pack(INPUT, acked_tick, first_seq, len(inputs)) + bytes(inputs)
+
+
+def decode_input(data):
+    _, acked_tick, first_seq, count = INPUT_PACKET.unpack_from(data)
+    return acked_tick, first_seq, data[INPUT_PACKET.size:INPUT_PACKET.size + count]
+
+
+def encode_bye():
+    return HEADER.pack(BYE)
+
+
+def encode_list(offset=0):
+    return LIST_PACKET.pack(LIST, offset)
+
+
+def decode_list(data):
+    return LIST_PACKET.unpack_from(data)[1] if len(data) >= LIST_PACKET.size else 0
+
+
+def encode_rooms(rooms, offset=0):
+    # rooms: list of (room id, port, players mask, finished); one page of
+    # ROOMS_PER_PACKET entries starting at `offset`
+    page = rooms[offset:offset + ROOMS_PER_PACKET]
+    return (ROOMS_PACKET.pack(ROOMS, len(rooms), offset, len(page))
+            + b"".join(ROOM_ENTRY.pack(*room) for room in page))
+
+
+def decode_rooms(data):
+    # (total room count, offset, entries)
+    _, total, offset, count = ROOMS_PACKET.unpack_from(data)
+    rooms = [ROOM_ENTRY.unpack_from(data, ROOMS_PACKET.size + i * ROOM_ENTRY.size)
+             for i in range(count)]
+    return total, offset, rooms
+
+
+def encode_redirect(port):
+    return PORT_PACKET.pack(REDIRECT, port)
+
+
+def decode_redirect(data):
+    return PORT_PACKET.unpack_from(data)[1]
+
+
+def encode_refused(reason):
+    return bytes((REFUSED, reason))
+
+
+def decode_refused(data):
+    return data[1] if len(data) > 1 else 0
+
+
+def make_view(sim, player_id, sight=None):
+    # sight: VisibilityMap of the level. Without it the ghost is sent the
+    # whole map, as in protocol 2.
+    hunter = sim.chasseur
+    ghost = sim.fantome
+    known = player_id == GHOST or ghost.lit
+    batteries = sim.batteries[:255]
+    seen = True
+    if player_id == GHOST and sight is not None and not sim.game_over:
+        # Same points as the client draws: hunter centre, battery centres.
+        # Imported here, the lobby uses this module without the simulation
+        from simulation import PLAYER_SIZE
+        half_size = PLAYER_SIZE / 2
+        cell = sight.cell(ghost.x + half_size, ghost.y + half_size)
+        points = [(hunter.x + half_size, hunter.y + half_size)]
+        points += [(battery.x, battery.y) for battery in batteries]
+        in_sight = sight.sees(cell, points).tolist()
+        seen = in_sight[0]
+        batteries = [battery for battery, visible in zip(batteries, in_sight[1:]) if visible]
+    if not sim.game_over:
+        match = 0
+    else:
+        match = HUNTER if sim.winner == "Chasseur" else GHOST
+    fields = (
+        round(hunter.x * POSITION_SCALE) if seen else 0,
+        round(hunter.y * POSITION_SCALE) if seen else 0,
+        hunter.alive | (seen and hunter.lampe_on) << 1 | seen << 2,
+        round(hunter.batterie_lampe * 10),
+        round(math.degrees(hunter.facing)) % 360 if seen else 0,
+        round(ghost.x * POSITION_SCALE) if known else 0,
+        round(ghost.y * POSITION_SCALE) if known else 0,
+        ghost.alive | ghost.lit << 1 | known << 2,
+        round(ghost.points_de_vie * 100),
+        # The distance would place an unseen hunter on a circle
+        min(0xFFFF, round(math.hypot(hunter.x - ghost.x, hunter.y - ghost.y))) if seen else 0xFFFF,
+        match,
+    )
+    batteries = tuple((battery.x, battery.y) for battery in batteries)
+    return fields, batteries
+
+
+def apply_view(sim, view):
+    # Copy a view into a simulation used as a client-side mirror
+    fields, batteries = view
+    hunter = sim.chasseur
+    ghost = sim.fantome
+    sim.hunter_seen = bool(fields[HUNTER_FLAGS] & SEEN)
+    if sim.hunter_seen:
+        hunter.x = hunter.prev_x = fields[HUNTER_X] / POSITION_SCALE
+        hunter.y = hunter.prev_y = fields[HUNTER_Y] / POSITION_SCALE
+        hunter.facing = math.radians(fields[FACING])
+    hunter.alive = bool(fields[HUNTER_FLAGS] & ALIVE)
+    hunter.lampe_on = bool(fields[HUNTER_FLAGS] & LAMP_ON)
+    hunter.batterie_lampe = fields[BATTERY] / 10
+
+    if fields[GHOST_FLAGS] & KNOWN:
+        ghost.x = ghost.prev_x = fields[GHOST_X] / POSITION_SCALE
+        ghost.y = ghost.prev_y = fields[GHOST_Y] / POSITION_SCALE
+    ghost.alive = bool(fields[GHOST_FLAGS] & ALIVE)
+    ghost.visible = ghost.lit = bool(fields[GHOST_FLAGS] & LIT)
+    ghost.points_de_vie = fields[GHOST_LIFE] / 100
+    sim.detector = fields[DETECTOR]
+
+    sim.batteries = [BatteryRecharge(x, y, 0) for x, y in batteries]
+    sim.game_over = fields[MATCH] != 0
+    sim.winner = {HUNTER: "Chasseur", GHOST: "Fantôme"}.get(fields[MATCH])
+
+
+def write_varint(out, value):
+    # Zigzag then LEB128, small deltas take one byte
+    value = (value << 1) ^ (value >> 63)
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def read_varint(data, offset):
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+        if byte < 0x80:
+            return (value >> 1) ^ -(value & 1), offset
+
+
+def encode_snapshot(tick, baseline_tick, last_seq, view, baseline):
+    fields, batteries = view
+    base_fields, base_batteries = baseline
+    mask = 0
+    deltas = bytearray()
+    for i in range(FIELD_COUNT):
+        if fields[i] != base_fields[i]:
+            mask |= 1 << i
+            write_varint(deltas, fields[i] - base_fields[i])
+    if batteries != base_batteries:
+        mask |= BATTERIES_CHANGED
+        deltas.append(len(batteries))
+        for position in batteries:
+            deltas += BATTERY_POSITION.pack(*position)
+    return SNAPSHOT_PACKET.pack(SNAPSHOT, tick, baseline_tick, last_seq, mask) + deltas
+
+
+def decode_snapshot(data, views):
+    # views: tick -> view already received. Returns (tick, last input
+    # sequence, view), or None when the baseline is not known anymore.
+    _, tick, baseline_tick, last_seq, mask = SNAPSHOT_PACKET.unpack_from(data)
+    if baseline_tick == NO_BASELINE:
+        baseline = EMPTY_VIEW
+    else:
+        baseline = views.get(baseline_tick)
+        if baseline is None:
+            return None
+
+    base_fields, batteries = baseline
+    fields = list(base_fields)
+    offset = SNAPSHOT_PACKET.size
+    for i in range(FIELD_COUNT):
+        if mask & 1 << i:
+            delta, offset = read_varint(data, offset)
+            fields[i] += delta
+    if mask & BATTERIES_CHANGED:
+        count = data[offset]
+        offset += 1
+        batteries = tuple(BATTERY_POSITION.unpack_from(data, offset + i * BATTERY_POSITION.size)
+                          for i in range(count))
+    return tick, last_seq, (tuple(fields), batteries)
@@ -0,0 +1,191 @@
+# replay.py
+import argparse
+import os
+import struct
+import sys
+import time
+import zlib
+from level import load_level
+from simulation import Simulation, Inputs, TICK_RATE
+
+SNAPSHOT_EVERY = TICK_RATE * 10  # Ticks between two seek points (10 s of play)
+
+# Recorded match (.replay), little endian:
+#   header (REPLAY_HEADER)   magic, version, tick rate, match seed, ticks,
+#                            winner, checksum of the final state
+#   level name               u8 length + UTF-8
+#   inputs                   zlib, one byte per tick (pack_inputs)
+REPLAY_MAGIC = b"GCRP"
+REPLAY_VERSION = 1
+REPLAY_HEADER = struct.Struct("<4sHHIIBI")
+WINNERS = (None, "Chasseur", "Fantôme")
+
+# Final state hashed by checksum(): a replay that does not end on the same
+# value has desynced (the rules or the level changed since the recording)
+PLAYER_STATE = struct.Struct("<ddd?")
+
+
+def pack_inputs(inputs):
+    # Both players' directions in base 3 and the lamp toggle: 162 values,
+    # one byte per tick
+    value = ((inputs.hunter_dx + 1) * 27 + (inputs.hunter_dy + 1) * 9
+             + (inputs.ghost_dx + 1) * 3 + inputs.ghost_dy + 1)
+    return value * 2 + bool(inputs.toggle_lamp)
+
+
+def unpack_inputs(value):
+    value, toggle_lamp = divmod(value, 2)
+    value, ghost_dy = divmod(value, 3)
+    value, ghost_dx = divmod(value, 3)
+    hunter_dx, hunter_dy = divmod(value, 3)
+    return Inputs(hunter_dx - 1, hunter_dy - 1, ghost_dx - 1, ghost_dy - 1, bool(toggle_lamp))
+
+
+def checksum(sim):
+    data = bytearray(struct.pack("<d", sim.time))
+    for player in sim.players.values():
+        data += PLAYER_STATE.pack(player.x, player.y, player.points_de_vie, player.alive)
+    data += struct.pack("<d", sim.chasseur.batterie_lampe)
+    return zlib.crc32(data)
+
+
+class Replay:
+    # A recorded match: level, seed and one input per tick
+    def __init__(self, level_name, seed, inputs=b"", winner=None, final_checksum=0, tick_rate=TICK_RATE):
+        self.level_name = level_name
+        self.seed = seed
+        self.inputs = bytearray(inputs)
+        self.winner = winner
+        self.final_checksum = final_checksum
+        self.tick_rate = tick_rate
+
+    def __len__(self):
+        return len(self.inputs)
+
+    def save(self, path):
+        name = self.level_name.encode()
+        with open(path, "wb") as f:
+            f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, self.tick_rate, self.seed,
+                                       len(self.inputs), WINNERS.index(self.winner), self.final_checksum))
+            f.write(bytes((len(name),)) + name)
+            f.write(zlib.compress(bytes(self.inputs), 9))
+        return path
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        if len(data) < REPLAY_HEADER.size + 1:
+            raise ValueError(f"{path}: not a replay")
+        magic, version, tick_rate, seed, ticks, winner, final_checksum = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path}: not a replay, or an unsupported version")
+        offset = REPLAY_HEADER.size
+        name_length = data[offset]
+        level_name = data[offset + 1:offset + 1 + name_length].decode()
+        inputs = zlib.decompress(data[offset + 1 + name_length:])
+        if len(inputs) != ticks:
+            raise ValueError(f"{path}: truncated replay")
+        return cls(level_name, seed, inputs, WINNERS[winner], final_checksum, tick_rate)
+
+
+class Recorder:
+    # Records the match being played on a Simulation: add() every tick
+    # before sim.step, save() when it ends (or is abandoned)
+    def __init__(self, sim):
+        if len(sim.players) > 2:
+            raise ValueError("replays only record matches of one hunter against one ghost")
+        self.sim = sim
+        self.replay = Replay(sim.level.source, sim.seed)
+
+    def add(self, inputs):
+        self.replay.inputs.append(pack_inputs(inputs))
+
+    def finish(self):
+        # The replay, with the outcome of the match as played so far
+        self.replay.winner = self.sim.winner
+        self.replay.final_checksum = checksum(self.sim)
+        return self.replay
+
+    def save(self, directory, prefix="ghostchase"):
+        os.makedirs(directory, exist_ok=True)
+        name = f"{prefix}-{time.strftime('%Y%m%d-%H%M%S')}-{self.sim.seed:08x}.replay"
+        return self.finish().save(os.path.join(directory, name))
+
+
+class ReplayRunner:
+    # Re-simulates a replay headlessly. A state snapshot is kept every
+    # SNAPSHOT_EVERY ticks on the way, so seek() restores the closest one
+    # before the target and only simulates the rest.
+    def __init__(self, replay, snapshot_every=SNAPSHOT_EVERY, level=None):
+        if replay.tick_rate != TICK_RATE:
+            raise ValueError(f"replay recorded at {replay.tick_rate} Hz, the simulation runs at {TICK_RATE} Hz")
+        self.replay = replay
+        self.snapshot_every = snapshot_every
+        self.sim = Simulation(level or load_level(replay.level_name))
+        self.sim.reset(replay.seed)
+        self.tick = 0
+        self.snapshots = {0: self.sim.state()}  # Tick -> Simulation.state()
+
+    def step(self):
+        # Play one recorded tick; False at the end of the replay
+        if self.tick >= len(self.replay):
+            return False
+        self.sim.step(unpack_inputs(self.replay.inputs[self.tick]))
+        self.tick += 1
+        if self.tick % self.snapshot_every == 0 and self.tick not in self.snapshots:
+            self.snapshots[self.tick] = self.sim.state()
+        return True
+
+    def run(self, ticks=None):
+        # Play `ticks` ticks, or up to the end, as fast as possible
+        end = len(self.replay) if ticks is None else min(len(self.replay), self.tick + ticks)
+        while self.tick < end:
+            self.step()
+
+    def seek(self, tick):
+        tick = max(0, min(tick, len(self.replay)))
+        start = max(known for known in self.snapshots if known <= tick)
+        if not start <= self.tick <= tick:
+            self.sim.restore(self.snapshots[start])
+            self.tick = start
+        self.run(tick - self.tick)
+
+    def desynced(self):
+        # Only meaningful at the end of the replay
+        return (self.sim.winner != self.replay.winner
+                or checksum(self.sim) != self.replay.final_checksum)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghost Chase headless replay")
+    parser.add_argument("replay", help=".replay file (GHOSTCHASE_RECORD=DIR python game.py, server.py --record DIR)")
+    parser.add_argument("--seek", type=float, metavar="SECONDS", help="print the state at this match time")
+    args = parser.parse_args()
+
+    replay = Replay.load(args.replay)
+    runner = ReplayRunner(replay)
+    start = time.perf_counter()
+    runner.run()
+    elapsed = time.perf_counter() - start
+    sim = runner.sim
+    print(f"{args.replay}: level {replay.level_name}, seed {replay.seed}, "
+          f"{len(replay)} ticks ({len(replay) / TICK_RATE:.1f} s), winner {sim.winner or 'none'}")
+    print(f"re-simulated in {elapsed:.3f} s ({len(replay) / max(elapsed, 1e-9):.0f} ticks/s)")
+
+    if args.seek is not None:
+        start = time.perf_counter()
+        runner.seek(round(args.seek * TICK_RATE))
+        elapsed = time.perf_counter() - start
+        print(f"at {sim.time / 1000:.2f} s (seek {elapsed * 1000:.1f} ms): "
+              f"hunter ({sim.chasseur.x:.1f}, {sim.chasseur.y:.1f}) battery {sim.chasseur.batterie_lampe:.1f}, "
+              f"ghost ({sim.fantome.x:.1f}, {sim.fantome.y:.1f}) life {sim.fantome.points_de_vie:.2f}")
+        runner.run()
+
+    if runner.desynced():
+        print(f"DESYNC: recorded winner {replay.winner or 'none'}, final state differs")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
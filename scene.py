@@ -0,0 +1,90 @@
+# scene.py
+import pygame
+
+WALL_COLOR = (180, 180, 180)
+FOG_COLOR = (0, 0, 0, 200)  # Over what the player cannot see
+
+
+class StaticScene:
+    # Everything that never moves during a match (background and walls),
+    # composited once per level in the display pixel format. Frames then
+    # only restore the small areas moving things were drawn over.
+    def __init__(self, background, walls, size):
+        self.clear = pygame.Surface(size).convert()
+        self.clear.blit(background.convert(), (0, 0))
+        for wall in walls.tolist():
+            pygame.draw.rect(self.clear, WALL_COLOR, wall)
+        self.surface = self.clear
+        self.fogged = None  # Scene with fog of war, and the fog layer
+        self.fog = None
+        self.sight_rect = None  # Bounds of the hole in the fog, None without fog
+
+    def set_sight(self, polygon):
+        # Bakes the fog of war over everything outside the polygon the
+        # player sees, or clears it (None). Returns the area that changed,
+        # None when the screen needs a full redraw. Moving to the next cell
+        # only rebakes the bounds of the old and new polygons.
+        if polygon is None:
+            self.surface = self.clear
+            self.sight_rect = None
+            return None
+        if self.fogged is None:
+            self.fogged = self.clear.copy()
+            self.fog = pygame.Surface(self.clear.get_size(), pygame.SRCALPHA)
+        left, top = polygon.min(axis=0).astype(int).tolist()
+        right, bottom = polygon.max(axis=0).astype(int).tolist()
+        rect = pygame.Rect(left, top, right - left + 2, bottom - top + 2)
+        if self.sight_rect is None:
+            area = self.fog.get_rect()
+        else:
+            area = rect.union(self.sight_rect).clip(self.fog.get_rect())
+        self.fog.fill(FOG_COLOR, area)
+        # Drawing does not blend: this cuts a transparent hole in the fog
+        pygame.draw.polygon(self.fog, (0, 0, 0, 0), polygon.tolist())
+        self.fogged.blit(self.clear, area, area)
+        self.fogged.blit(self.fog, area, area)
+        changed = area if self.sight_rect is not None else None
+        self.surface = self.fogged
+        self.sight_rect = rect
+        return changed
+
+    def draw(self, screen):
+        screen.blit(self.surface, (0, 0))
+
+    def restore(self, screen, rects):
+        # Copy the static scene back over the given screen areas
+        for rect in rects:
+            screen.blit(self.surface, rect, rect)
+
+
+class DirtyRects:
+    # Screen areas drawn this frame and the previous one. The previous
+    # ones have to be restored and both have to be sent to the display.
+    def __init__(self):
+        self.previous = []
+        self.current = []
+        self.full_redraw = True
+
+    def add(self, rect):
+        if rect:
+            self.current.append(rect)
+        return rect
+
+    def invalidate(self):
+        # Next frame redraws and flips the whole screen
+        self.full_redraw = True
+
+    def expose(self, rect):
+        # Area of the static scene that changed: restored and sent this frame
+        self.previous.append(rect)
+
+    def end_frame(self):
+        # Rects to send to pygame.display.update, or None for a full flip
+        if self.full_redraw:
+            updated = None
+            self.full_redraw = False
+        else:
+            updated = self.previous + self.current
+        self.previous = self.current
+        self.current = []
+        return updated
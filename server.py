@@ -0,0 +1,394 @@
+# server.py
+import argparse
+import asyncio
+import itertools
+import time
+from profiler import RollingStats
+from metrics import Metrics, MetricsFile, serve_metrics
+from level import load_level, DEFAULT_LEVEL
+from simulation import Simulation, Inputs, TICK_MS, TICK_RATE
+import protocol
+import ai
+from replay import Recorder
+from spatial import WallGrid
+from visibility import VisibilityMap
+
+SNAPSHOT_EVERY = 4  # Ticks between two snapshots (30 Hz at 120 Hz)
+HISTORY = 64  # Views kept per client as delta baselines
+MAX_BUFFERED_INPUTS = 32  # Inputs a client may send ahead of the server
+CLIENT_TIMEOUT = 10.0  # Seconds of silence before a client is dropped
+
+
+class ClientSlot:
+    def __init__(self, address, match, player_id):
+        self.address = address
+        self.match = match
+        self.player_id = player_id
+        self.inputs = {}  # Sequence -> packed input, not applied yet
+        self.last_seq = 0  # Last input sequence applied
+        self.last_input = protocol.pack_input(0, 0, False)
+        self.acked_tick = protocol.NO_BASELINE
+        self.history = {}  # Tick -> view sent
+        self.last_heard = time.monotonic()
+        self.bytes_sent = 0
+        self.bytes_received = 0
+
+    def receive_inputs(self, first_seq, inputs):
+        for i, value in enumerate(inputs):
+            seq = first_seq + i
+            if self.last_seq < seq <= self.last_seq + MAX_BUFFERED_INPUTS:
+                self.inputs[seq] = value
+
+    def next_input(self):
+        # One input per tick; a late client keeps its last direction
+        value = self.inputs.pop(self.last_seq + 1, None)
+        if value is None:
+            return protocol.unpack_input(self.last_input)[:2] + (False,)
+        self.last_seq += 1
+        self.last_input = value
+        return protocol.unpack_input(value)
+
+
+class BotSlot(ClientSlot):
+    # AI player with no address (ai.py), seated opposite a lone client or in
+    # bot-only rooms for capacity tests; every snapshot is acknowledged as
+    # soon as it is sent
+    def __init__(self, match, player_id):
+        super().__init__(None, match, player_id)
+        self.bot = None
+
+    def next_input(self):
+        player = self.match.sim.players[self.player_id]
+        if self.bot is None or self.bot.player is not player:
+            # First tick, or the match restarted with new players
+            bot_class = ai.HunterBot if self.player_id == protocol.HUNTER else ai.GhostBot
+            self.bot = bot_class(ai.flow_fields_for(self.match.level), player,
+                                 phase=self.match.room_id * 2 + self.player_id)
+        self.last_seq += 1
+        return self.bot.decide(self.match.sim)
+
+
+class Match:
+    # One authoritative simulation and its players
+    def __init__(self, room_id, level, seed=None):
+        self.room_id = room_id
+        self.level = level
+        self.sim = Simulation(level, seed)
+        self.slots = {}  # Player id -> ClientSlot
+        self.tick = 0
+        self.finished_at = None
+        self.waiting_since = time.monotonic()  # Since a client is alone
+        self.recorder = None  # Set when the server records replays
+
+    def free_player_id(self):
+        for player_id in (protocol.HUNTER, protocol.GHOST):
+            if player_id not in self.slots:
+                return player_id
+        return None
+
+    def players_mask(self):
+        mask = 0
+        for player_id in self.slots:
+            mask |= 1 << (player_id - 1)
+        return mask
+
+    def step(self):
+        inputs = Inputs()
+        hunter = self.slots.get(protocol.HUNTER)
+        if hunter:
+            inputs.hunter_dx, inputs.hunter_dy, inputs.toggle_lamp = hunter.next_input()
+        ghost = self.slots.get(protocol.GHOST)
+        if ghost:
+            inputs.ghost_dx, inputs.ghost_dy, _ = ghost.next_input()
+        if self.recorder and not self.sim.game_over:
+            self.recorder.add(inputs)
+        self.sim.step(inputs, TICK_MS)
+        self.tick += 1
+
+    def restart(self):
+        self.sim.reset()
+        self.finished_at = None
+        if self.recorder:
+            self.recorder = Recorder(self.sim)
+
+    def has_clients(self):
+        return any(not isinstance(slot, BotSlot) for slot in self.slots.values())
+
+
+class GameServer(asyncio.DatagramProtocol):
+    # Authoritative server: runs every room (one match each) at TICK_RATE and
+    # sends each client a delta-compressed snapshot of its own view every
+    # SNAPSHOT_EVERY ticks. Clients join a given room, open a new one, or
+    # are paired with whoever is waiting. `room_ids` hands out the room ids,
+    # match_host.py gives each worker process its own sequence.
+    def __init__(self, level_name=DEFAULT_LEVEL, snapshot_every=SNAPSHOT_EVERY, room_ids=None,
+                 fill_bots=0, record=None):
+        self.level_name = level_name
+        self.level = load_level(level_name)
+        self.flow = ai.flow_fields_for(self.level)  # Shared by the bots of every room
+        # Ghost line of sight for the views, shared by every room
+        self.sight = VisibilityMap(self.level.walls, WallGrid(self.level.walls.tolist()))
+        self.snapshot_every = snapshot_every
+        self.fill_bots = fill_bots  # Seconds before a lone client gets a bot, 0: never
+        self.record_dir = record  # Matches with clients are saved there as replays
+        self.room_ids = room_ids or itertools.count(1)
+        self.rooms = {}  # Room id -> Match
+        self.clients = {}  # Address -> ClientSlot
+        self.transport = None
+        self.port = 0
+        self.running = True
+        self.reset_stats()
+        self.metrics = Metrics()  # Lifetime telemetry, never reset
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.port = transport.get_extra_info("sockname")[1]
+
+    def reset_stats(self):
+        self.tick_stats = RollingStats(TICK_RATE * 10)
+        self.ticks = 0
+        self.stats_since = time.perf_counter()
+
+    def datagram_received(self, data, address):
+        kind = protocol.packet_type(data)
+        slot = self.clients.get(address)
+        if slot is not None:
+            slot.last_heard = time.monotonic()
+            slot.bytes_received += len(data)
+
+        if kind == protocol.HELLO:
+            if slot is None:
+                version, room_id = protocol.decode_hello(data)
+                if version != protocol.VERSION:
+                    self.transport.sendto(protocol.encode_refused(protocol.BAD_VERSION), address)
+                    return
+                slot = self.join(address, room_id)
+                if not isinstance(slot, ClientSlot):
+                    self.transport.sendto(protocol.encode_refused(slot), address)
+                    return
+            self.send(slot, protocol.encode_welcome(slot.player_id, self.snapshot_every,
+                                                    slot.match.room_id, self.level_name))
+        elif kind == protocol.LIST:
+            self.transport.sendto(protocol.encode_rooms(self.room_list(), protocol.decode_list(data)),
+                                  address)
+        elif kind == protocol.INPUT and slot is not None:
+            acked_tick, first_seq, inputs = protocol.decode_input(data)
+            if acked_tick in slot.history:
+                slot.acked_tick = acked_tick
+            slot.receive_inputs(first_seq, inputs)
+        elif kind == protocol.BYE and slot is not None:
+            self.leave(slot)
+
+    def new_room(self):
+        match = Match(next(self.room_ids), self.level)
+        if self.record_dir:
+            match.recorder = Recorder(match.sim)
+        self.rooms[match.room_id] = match
+        return match
+
+    def save_replay(self, match):
+        if match.recorder and len(match.recorder.replay):
+            match.recorder.save(self.record_dir, f"room{match.room_id}")
+
+    def join(self, address, room_id=protocol.ANY_ROOM):
+        # Seat a client; returns its slot, or a REFUSED reason
+        if room_id == protocol.ANY_ROOM:
+            match = next((match for match in self.rooms.values()
+                          if match.free_player_id() is not None), None) or self.new_room()
+        elif room_id == protocol.NEW_ROOM:
+            match = self.new_room()
+        else:
+            match = self.rooms.get(room_id)
+            if match is None:
+                return protocol.NO_SUCH_ROOM
+        player_id = match.free_player_id()
+        if player_id is None:
+            return protocol.ROOM_FULL
+        slot = ClientSlot(address, match, player_id)
+        match.slots[player_id] = slot
+        match.waiting_since = time.monotonic()
+        self.clients[address] = slot
+        return slot
+
+    def leave(self, slot):
+        # A room left to bots is closed
+        match = slot.match
+        del self.clients[slot.address]
+        del match.slots[slot.player_id]
+        if not match.has_clients():
+            if not match.sim.game_over:
+                self.save_replay(match)  # Abandoned before the end
+                self.metrics.abandon_match(match.sim)
+            del self.rooms[match.room_id]
+        else:
+            match.waiting_since = time.monotonic()
+
+    def fill_with_bots(self, now):
+        # Seat a bot opposite clients left alone for fill_bots seconds
+        for match in self.rooms.values():
+            player_id = match.free_player_id()
+            if player_id is not None and now - match.waiting_since > self.fill_bots:
+                match.slots[player_id] = BotSlot(match, player_id)
+
+    def set_bot_rooms(self, count):
+        # Replace the bot-only rooms by `count` new ones
+        for match in list(self.rooms.values()):
+            if all(isinstance(slot, BotSlot) for slot in match.slots.values()):
+                del self.rooms[match.room_id]
+        for _ in range(count):
+            match = self.new_room()
+            for player_id in (protocol.HUNTER, protocol.GHOST):
+                match.slots[player_id] = BotSlot(match, player_id)
+
+    def room_list(self):
+        return [(match.room_id, self.port, match.players_mask(), match.sim.game_over)
+                for match in self.rooms.values()]
+
+    def send(self, slot, data):
+        slot.bytes_sent += len(data)
+        if slot.address is not None:
+            self.transport.sendto(data, slot.address)
+
+    def send_snapshots(self, match):
+        for slot in match.slots.values():
+            view = protocol.make_view(match.sim, slot.player_id, self.sight)
+            baseline = slot.history.get(slot.acked_tick)
+            if baseline is None:
+                data = protocol.encode_snapshot(match.tick, protocol.NO_BASELINE, slot.last_seq,
+                                                view, protocol.EMPTY_VIEW)
+            else:
+                data = protocol.encode_snapshot(match.tick, slot.acked_tick, slot.last_seq,
+                                                view, baseline)
+            self.send(slot, data)
+            slot.history[match.tick] = view
+            if len(slot.history) > HISTORY:
+                del slot.history[min(slot.history)]
+            if slot.address is None:
+                slot.acked_tick = match.tick  # Bots never lose a snapshot
+
+    def tick(self):
+        now = time.monotonic()
+        for slot in list(self.clients.values()):
+            if now - slot.last_heard > CLIENT_TIMEOUT:
+                self.leave(slot)
+        if self.fill_bots:
+            self.fill_with_bots(now)
+
+        self.flow.start_tick()
+        for match in self.rooms.values():
+            if match.sim.game_over:
+                if match.finished_at is None:
+                    match.finished_at = now
+                    if match.has_clients():  # Not the bot-only capacity rooms
+                        self.save_replay(match)
+                        self.metrics.end_match(match.sim)
+                elif now - match.finished_at > protocol.RESTART_DELAY:
+                    match.restart()
+            match.step()
+            if match.tick % self.snapshot_every == 0:
+                self.send_snapshots(match)
+
+    async def run(self):
+        # Fixed-rate tick loop, scheduled on absolute times so it does not drift
+        period = TICK_MS / 1000
+        next_tick = time.perf_counter()
+        while self.running:
+            start = time.perf_counter()
+            self.tick()
+            self.ticks += 1
+            elapsed = (time.perf_counter() - start) * 1000
+            self.tick_stats.add(elapsed)
+            self.metrics.count("ticks")
+            self.metrics.observe("tick_ms", elapsed)
+
+            next_tick += period
+            delay = next_tick - time.perf_counter()
+            if delay < -0.25:
+                # Too far behind, skip ahead instead of bursting ticks
+                next_tick = time.perf_counter()
+            await asyncio.sleep(max(0.0, delay))
+
+    def stats(self):
+        # tick_rate falls under TICK_RATE when the server cannot keep up
+        return {
+            "matches": len(self.rooms),
+            "clients": len(self.clients),
+            "tick_ms": self.tick_stats.summary(),
+            "tick_rate": self.ticks / max(1e-9, time.perf_counter() - self.stats_since),
+            "bytes_sent": sum(slot.bytes_sent for slot in self.clients.values()),
+            "bytes_received": sum(slot.bytes_received for slot in self.clients.values()),
+        }
+
+    def metrics_snapshot(self):
+        self.metrics.set("rooms", len(self.rooms))
+        self.metrics.set("clients", len(self.clients))
+        return self.metrics.snapshot()
+
+    def metrics_text(self):
+        self.metrics_snapshot()
+        return self.metrics.text()
+
+
+async def serve(host="0.0.0.0", port=5656, level_name=DEFAULT_LEVEL, report_every=0, fill_bots=0,
+                record=None, metrics_port=None, metrics_file=None):
+    loop = asyncio.get_running_loop()
+    transport, server = await loop.create_datagram_endpoint(
+        lambda: GameServer(level_name, fill_bots=fill_bots, record=record), local_addr=(host, port))
+    print(f"Ghost Chase server on {host}:{port} ({TICK_RATE} Hz)")
+    reporter = None
+    if report_every:
+        async def report():
+            while True:
+                await asyncio.sleep(report_every)
+                stats = server.stats()
+                tick = stats["tick_ms"]
+                print(f"{stats['matches']} matches, {stats['clients']} clients, "
+                      f"tick mean {tick['mean']:.3f} ms p99 {tick['p99']:.3f} ms")
+        reporter = asyncio.ensure_future(report())
+    endpoint = None
+    if metrics_port:
+        endpoint = await serve_metrics(server.metrics_text, port=metrics_port)
+        print(f"Metrics on http://127.0.0.1:{metrics_port}/metrics")
+    dumper = None
+    if metrics_file:
+        dump = MetricsFile(metrics_file, server.metrics_text)
+
+        async def dump_metrics():
+            while True:
+                await asyncio.sleep(dump.every)
+                dump.write()
+        dumper = asyncio.ensure_future(dump_metrics())
+    try:
+        await server.run()
+    finally:
+        for task in (reporter, dumper):
+            if task:
+                task.cancel()
+        if endpoint:
+            endpoint.close()
+        transport.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ghost Chase authoritative server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5656)
+    parser.add_argument("--level", default=DEFAULT_LEVEL)
+    parser.add_argument("--report", type=float, default=0, metavar="SECONDS",
+                        help="print tick statistics periodically")
+    parser.add_argument("--fill-bots", type=float, default=0, metavar="SECONDS",
+                        help="seat an AI opponent after a client waited this long alone")
+    parser.add_argument("--record", metavar="DIR", help="save every match as a replay (replay.py)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve metrics as text on http://127.0.0.1:PORT/")
+    parser.add_argument("--metrics-file", metavar="FILE", help="write metrics to FILE every 10 seconds")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.level, args.report, args.fill_bots, args.record,
+                          args.metrics_port, args.metrics_file))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
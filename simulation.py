@@ -0,0 +1,296 @@
+# simulation.py
+import math
+import random
+from entities import Chasseur, Fantome, BatteryRecharge
+from level import load_level
+from profiler import NULL_PROFILER
+from spatial import WallGrid, SpatialHash
+from spawn import SpawnSampler
+from visibility import cone_hits, segments_blocked
+
+PLAYER_SIZE = 20  # Approximate player size
+LIGHT_RADIUS = 200
+LIGHT_ANGLE = 60  # Wider angle for better playability
+DIAGONAL = 0.7071  # 1/sqrt(2)
+LAMP_COOLDOWN = 500  # ms between two flashlight toggles
+LIGHT_DAMAGE = 3.0  # Ghost life drained per second in the light
+TICK_RATE = 120  # Simulation steps per second
+TICK_MS = 1000 / TICK_RATE
+CATCH_DISTANCE = 20  # A ghost this close to a hunter catches it
+PICKUP_DISTANCE = 30  # A hunter this close to a battery picks it up
+HASH_CELL = 100  # Spatial hash cell size (px), half the light radius
+
+# Plain attributes of a Simulation that change during a match (state())
+MATCH_STATE = ('time', 'game_over', 'winner', 'max_batteries', 'last_spawn_time', 'recharge_interval')
+
+
+def facing_angle(dx, dy):
+    # Flashlight direction (radians) for a key-driven direction
+    if dx == 0 and dy == 0:
+        return 0.0  # Default direction
+    return math.atan2(dy, dx)
+
+
+class Inputs:
+    # Input for one simulation step, independent of pygame.
+    # Directions are -1, 0 or 1 per axis; toggle_lamp is a key press edge.
+    # The fields drive the first hunter and ghost; `extra` maps the player
+    # id of any other one to (dx, dy, toggle_lamp), missing ones stand still.
+    __slots__ = ('hunter_dx', 'hunter_dy', 'ghost_dx', 'ghost_dy', 'toggle_lamp', 'extra')
+
+    def __init__(self, hunter_dx=0, hunter_dy=0, ghost_dx=0, ghost_dy=0, toggle_lamp=False, extra=None):
+        self.hunter_dx = hunter_dx
+        self.hunter_dy = hunter_dy
+        self.ghost_dx = ghost_dx
+        self.ghost_dy = ghost_dy
+        self.toggle_lamp = toggle_lamp
+        self.extra = extra
+
+    def for_player(self, player_id):
+        if player_id == 1:
+            return self.hunter_dx, self.hunter_dy, self.toggle_lamp
+        if player_id == 2:
+            return self.ghost_dx, self.ghost_dy, False
+        if self.extra:
+            return self.extra.get(player_id, (0, 0, False))
+        return 0, 0, False
+
+
+class Simulation:
+    # Game state and rules. Never touches the display, so it can run
+    # headless (tests, batch matches, servers) as fast as the CPU allows.
+    # A match has one or more hunters and ghosts; the first ones are
+    # chasseur and fantome, players 1 and 2 (the two-player protocol, the
+    # keyboard and the HUD only know those), the others follow from id 3.
+    def __init__(self, level=None, seed=None, hunters=1, ghosts=1):
+        self.seeds = random.Random(seed)  # One seed drawn per match
+        self.profiler = NULL_PROFILER  # Set by Game when profiling is on
+        self.hunter_count = hunters
+        self.ghost_count = ghosts
+        # Broad phase of the proximity checks, refilled every tick
+        self.ghost_hash = SpatialHash(HASH_CELL)
+        self.battery_hash = SpatialHash(HASH_CELL)
+        self.load_level(level or load_level())
+        self.reset()
+
+    def reset(self, seed=None):
+        # Start a new match on the loaded level. The level structures and
+        # the profiler are kept, so restarts are cheap. Each match has its
+        # own seed, so the level, the seed and the inputs replay it exactly.
+        self.seed = self.seeds.getrandbits(32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        self.time = 0  # Simulated time in ms
+        # Extra players share the level's spawn points in turn
+        hunter_spawns = self.level.hunter_spawns.tolist()
+        ghost_spawns = self.level.ghost_spawns.tolist()
+        self.hunters = [Chasseur(*hunter_spawns[i % len(hunter_spawns)]) for i in range(self.hunter_count)]
+        self.ghosts = [Fantome(*ghost_spawns[i % len(ghost_spawns)]) for i in range(self.ghost_count)]
+        self.chasseur = self.hunters[0]
+        self.fantome = self.ghosts[0]
+        self.players = dict(enumerate([self.chasseur, self.fantome] + self.hunters[1:] + self.ghosts[1:],
+                                      start=1))
+        # Hunters first, see step()
+        self.move_order = sorted(self.players.items(), key=lambda item: item[1].type != 'chasseur')
+
+        self.game_over = False
+        self.winner = None
+        self.batteries = []
+        self.max_batteries = 1  # Pickups allowed on the map at the same time
+        self.last_spawn_time = 0
+        self.recharge_interval = 15000
+        self.fill_broad_phase()
+
+    def fill_broad_phase(self):
+        # Ghosts and batteries as they stand, for this tick's proximity checks
+        self.ghost_hash.clear()
+        for ghost in self.ghosts:
+            if ghost.alive:
+                self.ghost_hash.insert(ghost, ghost.x, ghost.y)
+        self.battery_hash.clear()
+        for index, battery in enumerate(self.batteries):
+            self.battery_hash.insert(index, battery.x, battery.y)
+
+    def state(self):
+        # Copy of everything a match changes, for restore()
+        return {
+            "sim": {name: getattr(self, name) for name in MATCH_STATE},
+            "players": {player_id: player.get_state() for player_id, player in self.players.items()},
+            "batteries": [battery.get_state() for battery in self.batteries],
+            "rng": self.rng.getstate(),
+        }
+
+    def restore(self, state):
+        # Back to a state() of the same match. Players are updated in place,
+        # so whoever holds them (renderer, bots) keeps valid references.
+        for name, value in state["sim"].items():
+            setattr(self, name, value)
+        for player_id, values in state["players"].items():
+            self.players[player_id].set_state(values)
+        self.batteries = [BatteryRecharge.from_state(values) for values in state["batteries"]]
+        self.rng.setstate(state["rng"])
+        self.fill_broad_phase()
+
+    def load_level(self, level):
+        self.level = level
+        # (N, 4) array of x, y, width, height, viewed straight from the level file
+        self.walls = level.walls
+        # Spatial index used by every collision query
+        self.wall_grid = WallGrid(level.walls.tolist())
+        # Free cells precomputed by the level compiler
+        self.battery_spawner = SpawnSampler(level, level.battery_cells)
+
+    def step(self, inputs, dt=TICK_MS):
+        # Advance the match by dt milliseconds. Every rate is per second, so
+        # the outcome only depends on the inputs and the tick length.
+        # Hunters move first and meet the ghosts where they stood at the
+        # start of the tick, then the ghosts move.
+        if self.game_over:
+            return
+        self.time += dt
+        for player in self.players.values():
+            player.prev_x = player.x
+            player.prev_y = player.y
+
+        for ghost in self.ghosts:
+            ghost.lit = ghost.visible = False
+        self.fill_broad_phase()
+        self.profiler.lap("broad_phase")
+
+        # Whoever is alive at the start of the tick moves, even if caught
+        # or lit to death earlier in the same tick
+        movers = [(player_id, player) for player_id, player in self.move_order if player.alive]
+        for player_id, player in movers:
+            dx, dy, toggle_lamp = inputs.for_player(player_id)
+            if player.type == 'chasseur':
+                if toggle_lamp:
+                    self.toggle_lamp(player)
+                player.facing = facing_angle(dx, dy)
+            self.move_player(player, *self.normalize(dx, dy), dt)
+        self.profiler.lap("move_player")
+
+        self.update(dt)
+        self.profiler.lap("update")
+
+    @staticmethod
+    def normalize(dx, dy):
+        # Apply diagonal movement with normalized speed
+        if dx != 0 and dy != 0:
+            return dx * DIAGONAL, dy * DIAGONAL
+        return dx, dy
+
+    def toggle_lamp(self, hunter=None):
+        hunter = hunter or self.chasseur
+        if self.time - hunter.derniere_utilisation_lampe > LAMP_COOLDOWN:
+            hunter.lampe_on = not hunter.lampe_on
+            hunter.derniere_utilisation_lampe = self.time
+            hunter.lamp_uses += hunter.lampe_on
+
+    def update(self, dt):
+        current_time = self.time
+
+        # Update hunters' flashlights
+        for hunter in self.hunters:
+            if hunter.lampe_on:
+                if not hunter.use_light(dt):
+                    hunter.lampe_on = False
+
+        # Remove picked up batteries (check_collision only marks them)
+        if self.batteries and None in self.batteries:
+            self.batteries = [battery for battery in self.batteries if battery is not None]
+
+        # Spawn battery recharge if needed
+        if (len(self.batteries) < self.max_batteries and
+                current_time - self.last_spawn_time > self.recharge_interval):
+            self.last_spawn_time = current_time
+            position = self.battery_spawner.sample(self.rng)
+            if position is not None:
+                self.batteries.append(BatteryRecharge(*position, current_time))
+
+        # Remove battery recharges once expired
+        if self.batteries:
+            self.batteries = [battery for battery in self.batteries
+                              if current_time - battery.spawn_time <= battery.duration]
+
+        # Check if game is over: a side wins once the other is wiped out
+        if not any(ghost.alive for ghost in self.ghosts):
+            self.game_over = True
+            self.winner = "Chasseur"
+        elif not any(hunter.alive for hunter in self.hunters):
+            self.game_over = True
+            self.winner = "Fantôme"
+
+    def move_player(self, player, dx, dy, dt):
+        self.move_body(player, dx, dy, dt)
+        self.check_collision(player, dt)
+
+    def move_body(self, player, dx, dy, dt):
+        # Movement against the walls only (also used for client-side prediction)
+        new_x = player.x + dx * player.speed * dt / 1000
+        new_y = player.y + dy * player.speed * dt / 1000
+        if not self.collides_with_walls(new_x, new_y):
+            player.x = new_x
+            player.y = new_y
+
+    def detector_distance(self, hunter):
+        # Distance shown by the hunter's ghost detector: the nearest ghost
+        # of the broad phase, measured at its current position
+        found = self.ghost_hash.nearest(hunter.x, hunter.y)
+        if found is None:
+            return math.inf
+        ghost = found[0]
+        return math.sqrt((hunter.x - ghost.x) ** 2 + (hunter.y - ghost.y) ** 2)
+
+    def collides_with_walls(self, x, y):
+        return self.wall_grid.collides(x, y, PLAYER_SIZE, PLAYER_SIZE)
+
+    def light_hits(self, hunters, targets):
+        # (hunters, targets) mask of the targets lit by each hunter's lamp
+        half_size = PLAYER_SIZE / 2
+        poses = [(hunter.x + half_size, hunter.y + half_size, hunter.facing) for hunter in hunters]
+        centres = [(target.x + half_size, target.y + half_size) for target in targets]
+
+        # Only walls within reach of a lamp can block it
+        left = min(x for x, _, _ in poses) - LIGHT_RADIUS
+        top = min(y for _, y, _ in poses) - LIGHT_RADIUS
+        right = max(x for x, _, _ in poses) + LIGHT_RADIUS
+        bottom = max(y for _, y, _ in poses) + LIGHT_RADIUS
+        walls = self.walls[self.wall_grid.query(left, top, right - left, bottom - top)]
+        return cone_hits(poses, centres, LIGHT_RADIUS, LIGHT_ANGLE, walls)
+
+    def line_of_sight(self, x0, y0, x1, y1):
+        # True if no wall crosses the segment
+        walls = self.walls[self.wall_grid.query(min(x0, x1), min(y0, y1), abs(x1 - x0), abs(y1 - y0))]
+        return not len(walls) or not segments_blocked([x0], [y0], [x1], [y1], walls)[0]
+
+    def check_collision(self, player, dt):
+        # Hunter against the ghosts and batteries around it, from the spatial
+        # hashes filled at the start of the tick (ghosts check nothing)
+        if player.type != 'chasseur':
+            return
+
+        # Check if flashlight hits ghosts
+        if player.lampe_on:
+            ghosts = [ghost for ghost, _, _ in self.ghost_hash.near(player.x, player.y, LIGHT_RADIUS)]
+            if ghosts:
+                hits = self.light_hits([player], ghosts)[0]
+                for ghost, hit in zip(ghosts, hits):
+                    if hit:
+                        ghost.visible = True
+                        ghost.lit = True
+                        ghost.take_damage(LIGHT_DAMAGE * dt / 1000)
+
+        # Check if a ghost caught the hunter
+        for ghost, ghost_x, ghost_y in self.ghost_hash.near(player.x, player.y, CATCH_DISTANCE):
+            if math.sqrt((player.x - ghost_x) ** 2 + (player.y - ghost_y) ** 2) < CATCH_DISTANCE:
+                player.alive = False
+                break
+
+        # Check if hunter collects battery (the first one in spawn order)
+        if self.batteries:
+            near = sorted(index for index, x, y in self.battery_hash.near(player.x, player.y, PICKUP_DISTANCE)
+                          if self.batteries[index] is not None
+                          and math.sqrt((player.x - x) ** 2 + (player.y - y) ** 2) < PICKUP_DISTANCE)
+            if near:
+                player.batterie_lampe = min(100, player.batterie_lampe + 50)
+                player.pickups += 1
+                self.batteries[near[0]] = None  # Removed in update()
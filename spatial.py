@@ -0,0 +1,157 @@
+# spatial.py
+import math
+from array import array
+
+
+class WallGrid:
+    # Uniform grid index over axis-aligned wall rects, built once per map.
+    # Each cell lists the walls overlapping it in a compact CSR layout:
+    # the walls of cell c are wall_index[cell_start[c]:cell_start[c + 1]].
+    # A query only looks at the few cells under the queried rect, so its
+    # cost does not grow with the number of walls on the map.
+    def __init__(self, rects, cell_size=64):
+        self.cell_size = cell_size
+        self.left = array('d')
+        self.top = array('d')
+        self.right = array('d')
+        self.bottom = array('d')
+        for x, y, width, height in rects:
+            self.left.append(x)
+            self.top.append(y)
+            self.right.append(x + width)
+            self.bottom.append(y + height)
+
+        self.cols = max(1, int(max(self.right, default=0) // cell_size) + 1)
+        self.rows = max(1, int(max(self.bottom, default=0) // cell_size) + 1)
+
+        buckets = [[] for _ in range(self.cols * self.rows)]
+        for i in range(len(self.left)):
+            for cell in self.cells_in_rect(self.left[i], self.top[i],
+                                           self.right[i] - self.left[i], self.bottom[i] - self.top[i]):
+                buckets[cell].append(i)
+
+        self.cell_start = array('l', [0])
+        self.wall_index = array('l')
+        for bucket in buckets:
+            self.wall_index.extend(bucket)
+            self.cell_start.append(len(self.wall_index))
+
+    def __len__(self):
+        return len(self.left)
+
+    def cells_in_rect(self, x, y, width, height):
+        cell_size = self.cell_size
+        col_min = max(int(x // cell_size), 0)
+        col_max = min(int((x + width) // cell_size), self.cols - 1)
+        row_min = max(int(y // cell_size), 0)
+        row_max = min(int((y + height) // cell_size), self.rows - 1)
+        for row in range(row_min, row_max + 1):
+            for col in range(col_min, col_max + 1):
+                yield row * self.cols + col
+
+    def collides(self, x, y, width, height):
+        # True if the rect overlaps any wall
+        # (cell loop inlined, this is the movement hot path)
+        right = x + width
+        bottom = y + height
+        cell_size = self.cell_size
+        cols = self.cols
+        col_min = max(int(x // cell_size), 0)
+        col_max = min(int(right // cell_size), cols - 1)
+        row_min = max(int(y // cell_size), 0)
+        row_max = min(int(bottom // cell_size), self.rows - 1)
+        cell_start = self.cell_start
+        wall_index = self.wall_index
+        for row in range(row_min, row_max + 1):
+            for cell in range(row * cols + col_min, row * cols + col_max + 1):
+                for k in range(cell_start[cell], cell_start[cell + 1]):
+                    i = wall_index[k]
+                    if (x < self.right[i] and right > self.left[i] and
+                            y < self.bottom[i] and bottom > self.top[i]):
+                        return True
+        return False
+
+    def query(self, x, y, width, height):
+        # Sorted indices of the walls in the cells under the rect (broad phase)
+        found = set()
+        for cell in self.cells_in_rect(x, y, width, height):
+            found.update(self.wall_index[self.cell_start[cell]:self.cell_start[cell + 1]])
+        return sorted(found)
+
+
+class SpatialHash:
+    # Broad phase for moving points (players, pickups), rebuilt every tick.
+    # Occupied cells are kept in a dict keyed by (col, row), so building is
+    # O(n) and a query only visits the cells around it: proximity checks
+    # between n entities cost O(n) per tick instead of O(n^2). Queries
+    # return candidates; callers test the exact distance.
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}  # (col, row) -> [(item, x, y)]
+        self.bounds = None  # col_min, row_min, col_max, row_max of the occupied cells
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self.cells.values())
+
+    def clear(self):
+        self.cells.clear()
+        self.bounds = None
+
+    def insert(self, item, x, y):
+        col = int(x // self.cell_size)
+        row = int(y // self.cell_size)
+        bucket = self.cells.get((col, row))
+        if bucket is None:
+            self.cells[(col, row)] = [(item, x, y)]
+        else:
+            bucket.append((item, x, y))
+        if self.bounds is None:
+            self.bounds = (col, row, col, row)
+        else:
+            col_min, row_min, col_max, row_max = self.bounds
+            self.bounds = (min(col, col_min), min(row, row_min), max(col, col_max), max(row, row_max))
+
+    def near(self, x, y, radius):
+        # (item, x, y) of the points in the cells under the circle's bounding box
+        cell_size = self.cell_size
+        cells = self.cells
+        found = []
+        for row in range(int((y - radius) // cell_size), int((y + radius) // cell_size) + 1):
+            for col in range(int((x - radius) // cell_size), int((x + radius) // cell_size) + 1):
+                bucket = cells.get((col, row))
+                if bucket:
+                    found.extend(bucket)
+        return found
+
+    def nearest(self, x, y):
+        # (item, distance) of the closest point, None if empty. Rings of
+        # cells are searched outwards until no closer point can remain.
+        if self.bounds is None:
+            return None
+        cell_size = self.cell_size
+        col, row = int(x // cell_size), int(y // cell_size)
+        col_min, row_min, col_max, row_max = self.bounds
+        last_ring = max(col - col_min, col_max - col, row - row_min, row_max - row)
+        best, best_distance = None, math.inf
+        for ring in range(last_ring + 1):
+            if best_distance <= (ring - 1) * cell_size:
+                break  # Every point of this ring is farther than the best
+            for key in ring_cells(col, row, ring):
+                for item, item_x, item_y in self.cells.get(key, ()):
+                    distance = math.hypot(item_x - x, item_y - y)
+                    if distance < best_distance:
+                        best, best_distance = item, distance
+        return best, best_distance
+
+
+def ring_cells(col, row, ring):
+    # Cells at Chebyshev distance `ring` from (col, row)
+    if ring == 0:
+        yield col, row
+        return
+    for c in range(col - ring, col + ring + 1):
+        yield c, row - ring
+        yield c, row + ring
+    for r in range(row - ring + 1, row + ring):
+        yield col - ring, r
+        yield col + ring, r
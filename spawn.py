@@ -0,0 +1,71 @@
+# spawn.py
+
+
+class SpawnSampler:
+    # Picks spawn positions among a precomputed set of free cells of a level.
+    # Sampling is O(1): a uniform index, or Walker's alias method when the
+    # cells are weighted, so it never loops on crowded maps.
+    def __init__(self, level, cells, weights=None):
+        self.level = level
+        self.cells = [int(cell) for cell in cells]
+        self.weights = None if weights is None else [float(weight) for weight in weights]
+        self.zones = {}
+        self.prob = None
+        self.alias = None
+        if self.weights is not None:
+            if len(self.weights) != len(self.cells):
+                raise ValueError("one weight per cell is required")
+            self.build_alias_table()
+
+    def __len__(self):
+        return len(self.cells)
+
+    def build_alias_table(self):
+        count = len(self.weights)
+        total = sum(self.weights)
+        if total <= 0:
+            raise ValueError("spawn weights must not all be zero")
+        scaled = [weight * count / total for weight in self.weights]
+        self.prob = [1.0] * count
+        self.alias = list(range(count))
+        small = [i for i, p in enumerate(scaled) if p < 1]
+        large = [i for i, p in enumerate(scaled) if p >= 1]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.prob[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] += scaled[less] - 1
+            (small if scaled[more] < 1 else large).append(more)
+
+    def sample(self, rng):
+        # Pixel position of a free cell, or None if there is none
+        if not self.cells:
+            return None
+        i = rng.randrange(len(self.cells))
+        if self.prob is not None and rng.random() >= self.prob[i]:
+            i = self.alias[i]
+        return self.level.cell_position(self.cells[i])
+
+    def zone(self, x, y, width, height):
+        # Sampler restricted to the cells whose origin lies in the rect.
+        # Built once per zone, weights are kept.
+        key = (x, y, width, height)
+        sampler = self.zones.get(key)
+        if sampler is None:
+            cells = []
+            weights = None if self.weights is None else []
+            for i, cell in enumerate(self.cells):
+                cell_x, cell_y = self.level.cell_position(cell)
+                if not (x <= cell_x < x + width and y <= cell_y < y + height):
+                    continue
+                if weights is not None:
+                    if self.weights[i] <= 0:
+                        continue
+                    weights.append(self.weights[i])
+                cells.append(cell)
+            if not cells:
+                weights = None
+            sampler = SpawnSampler(self.level, cells, weights)
+            self.zones[key] = sampler
+        return sampler
@@ -0,0 +1,188 @@
+# visibility.py
+import math
+from collections import OrderedDict
+import numpy as np
+
+SIGHT_RADIUS = 300  # How far a player sees (px)
+SIGHT_CELL = 20  # Polygons are computed from the centre of these cells (px)
+SIGHT_SIDES = 48  # Sides of the polygon approximating the sight circle
+SIGHT_POLYGONS = 1024  # Polygons kept per level (LRU)
+CORNER_EPSILON = 1e-4  # Rays pass this far (radians) on each side of a corner
+
+
+def cone_hits(poses, targets, radius, light_angle, walls=None):
+    # Flashlight visibility for a batch of lights and targets.
+    # poses: (H, 3) light origins and facing angles (x, y, radians)
+    # targets: (T, 2) target centres
+    # walls: optional (N, 4) occluding rects (x, y, width, height)
+    # Returns an (H, T) bool mask of the targets lit by each light.
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 3)
+    targets = np.asarray(targets, dtype=np.float64).reshape(-1, 2)
+    origin_x = poses[:, 0:1]
+    origin_y = poses[:, 1:2]
+
+    # Range test
+    dx = targets[:, 0] - origin_x
+    dy = targets[:, 1] - origin_y
+    hits = dx * dx + dy * dy <= radius * radius
+
+    # Cone angle test
+    angle_diff = np.abs((np.arctan2(dy, dx) - poses[:, 2:3] + math.pi) % (2 * math.pi) - math.pi)
+    hits &= angle_diff <= math.radians(light_angle / 2)
+
+    # Light stops at walls: only the pairs that passed the cheap tests are traced
+    if walls is not None and len(walls) and hits.any():
+        light_index, target_index = np.nonzero(hits)
+        blocked = segments_blocked(poses[light_index, 0], poses[light_index, 1],
+                                   targets[target_index, 0], targets[target_index, 1], walls)
+        hits[light_index[blocked], target_index[blocked]] = False
+    return hits
+
+
+def segments_blocked(x0, y0, x1, y1, walls):
+    # Slab test of S segments against N rects, returns an (S,) bool mask.
+    # Segments only grazing a rect edge are not blocked.
+    walls = np.asarray(walls, dtype=np.float64).reshape(-1, 4)
+    x0 = np.asarray(x0, dtype=np.float64)[:, None]
+    y0 = np.asarray(y0, dtype=np.float64)[:, None]
+    dx = np.asarray(x1, dtype=np.float64)[:, None] - x0
+    dy = np.asarray(y1, dtype=np.float64)[:, None] - y0
+    dx = np.where(dx == 0, 1e-12, dx)
+    dy = np.where(dy == 0, 1e-12, dy)
+
+    tx1 = (walls[:, 0] - x0) / dx
+    tx2 = (walls[:, 0] + walls[:, 2] - x0) / dx
+    ty1 = (walls[:, 1] - y0) / dy
+    ty2 = (walls[:, 1] + walls[:, 3] - y0) / dy
+
+    t_enter = np.maximum(np.minimum(tx1, tx2), np.minimum(ty1, ty2))
+    t_exit = np.minimum(np.maximum(tx1, tx2), np.maximum(ty1, ty2))
+    crossed = (t_enter < t_exit) & (t_exit > 0) & (t_enter < 1)
+    return crossed.any(axis=1)
+
+
+def visibility_polygon(x, y, walls, radius=SIGHT_RADIUS, sides=SIGHT_SIDES):
+    # Area seen from (x, y) within `radius`, walls (N, 4) blocking the view.
+    # Rays are cast on both sides of every wall corner in range, at every
+    # vertex of the sight circle and where walls leave it, and stop at the
+    # nearest edge they meet; the hits in angle order are the polygon.
+    # Returns a (K, 2) array of points.
+    walls = np.asarray(walls, dtype=np.float64).reshape(-1, 4)
+    left, top = walls[:, 0], walls[:, 1]
+    right, bottom = left + walls[:, 2], top + walls[:, 3]
+
+    circle = np.linspace(0, 2 * math.pi, sides, endpoint=False)
+    circle_x = x + radius * np.cos(circle)
+    circle_y = y + radius * np.sin(circle)
+
+    # Edges: the sides of the walls facing the eye (the others are hidden
+    # behind them), then the sight circle
+    facing_top, facing_right, facing_bottom, facing_left = y <= top, x >= right, y >= bottom, x <= left
+    facing = np.concatenate((facing_top, facing_right, facing_bottom, facing_left, np.ones(sides, dtype=bool)))
+    start_x = np.concatenate((left, right, right, left, circle_x))[facing]
+    start_y = np.concatenate((top, top, bottom, bottom, circle_y))[facing]
+    end_x = np.concatenate((right, right, left, left, np.roll(circle_x, -1)))[facing]
+    end_y = np.concatenate((top, bottom, bottom, top, np.roll(circle_y, -1)))[facing]
+
+    # Corners of a facing side, in range (the rays just beside a corner
+    # meet the wall at the corner and the view past it)
+    corners_x = np.concatenate((left, right, right, left))
+    corners_y = np.concatenate((top, top, bottom, bottom))
+    cast = (np.concatenate((facing_top | facing_left, facing_top | facing_right,
+                            facing_bottom | facing_right, facing_bottom | facing_left))
+            & ((corners_x - x) ** 2 + (corners_y - y) ** 2 < radius * radius))
+    corner_angles = np.arctan2(corners_y[cast] - y, corners_x[cast] - x)
+    angles = np.concatenate((corner_angles - CORNER_EPSILON, corner_angles + CORNER_EPSILON, circle,
+                             circle_crossings(x, y, radius, start_x[:-sides], start_y[:-sides],
+                                              end_x[:-sides], end_y[:-sides])))
+    angles = np.unique((angles + math.pi) % (2 * math.pi) - math.pi)
+
+    # Ray (x, y) + t * (cos, sin) against edge start + s * (end - start)
+    ray_x = np.cos(angles)[:, None]
+    ray_y = np.sin(angles)[:, None]
+    edge_x = end_x - start_x
+    edge_y = end_y - start_y
+    to_x = start_x - x
+    to_y = start_y - y
+    denominator = ray_x * edge_y - ray_y * edge_x
+    parallel = np.abs(denominator) < 1e-12
+    denominator = np.where(parallel, 1.0, denominator)
+    t = (to_x * edge_y - to_y * edge_x) / denominator
+    s = (to_x * ray_y - to_y * ray_x) / denominator
+    t = np.where(parallel | (t < 0) | (s < 0) | (s > 1), np.inf, t)
+    distance = np.minimum(t.min(axis=1), radius)
+
+    return np.column_stack((x + distance * ray_x[:, 0], y + distance * ray_y[:, 0]))
+
+
+def circle_crossings(x, y, radius, start_x, start_y, end_x, end_y):
+    # Angles from (x, y) of the points where the edges cross the circle, so
+    # the polygon follows a wall up to the edge of sight
+    edge_x = end_x - start_x
+    edge_y = end_y - start_y
+    to_x = start_x - x
+    to_y = start_y - y
+    a = edge_x * edge_x + edge_y * edge_y
+    b = 2 * (to_x * edge_x + to_y * edge_y)
+    c = to_x * to_x + to_y * to_y - radius * radius
+    root = np.sqrt(np.maximum(b * b - 4 * a * c, 0))
+    s = np.concatenate(((-b - root) / (2 * a), (-b + root) / (2 * a)))
+    crossing_x = np.concatenate((to_x, to_x)) + s * np.concatenate((edge_x, edge_x))
+    crossing_y = np.concatenate((to_y, to_y)) + s * np.concatenate((edge_y, edge_y))
+    on_edge = (s >= 0) & (s <= 1) & np.concatenate((b * b >= 4 * a * c,) * 2)
+    return np.arctan2(crossing_y[on_edge], crossing_x[on_edge])
+
+
+def points_in_polygon(polygon, points):
+    # Even-odd test of P points (P, 2) against a polygon (K, 2), (P,) bool mask
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+    px = points[:, 0:1]
+    py = points[:, 1:2]
+    x0, y0 = polygon[:, 0], polygon[:, 1]
+    x1, y1 = np.roll(x0, -1), np.roll(y0, -1)
+    straddles = (y0 > py) != (y1 > py)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        crossing_x = x0 + (py - y0) * (x1 - x0) / (y1 - y0)
+    return (straddles & (px < crossing_x)).sum(axis=1) % 2 == 1
+
+
+class VisibilityMap:
+    # Line-of-sight polygons of a level for any number of players. A
+    # polygon is computed from the centre of the SIGHT_CELL cell the
+    # player's eye is in, so it only changes when the player crosses into
+    # another cell, and is kept in an LRU shared by every player. Only the
+    # walls within sight of the cell are cast against, so the cost does not
+    # grow with the size of the map.
+    def __init__(self, walls, wall_grid, radius=SIGHT_RADIUS, cell_size=SIGHT_CELL,
+                 max_polygons=SIGHT_POLYGONS):
+        self.walls = walls
+        self.wall_grid = wall_grid
+        self.radius = radius
+        self.cell_size = cell_size
+        self.max_polygons = max_polygons
+        self.polygons = OrderedDict()
+        self.computed = 0  # Polygons computed, for the benchmarks
+
+    def cell(self, x, y):
+        return int(x // self.cell_size), int(y // self.cell_size)
+
+    def polygon(self, cell):
+        # (K, 2) points seen from the centre of the cell
+        polygon = self.polygons.get(cell)
+        if polygon is not None:
+            self.polygons.move_to_end(cell)
+            return polygon
+        x = (cell[0] + 0.5) * self.cell_size
+        y = (cell[1] + 0.5) * self.cell_size
+        radius = self.radius
+        walls = self.walls[self.wall_grid.query(x - radius, y - radius, 2 * radius, 2 * radius)]
+        polygon = visibility_polygon(x, y, walls, radius)
+        self.polygons[cell] = polygon
+        self.computed += 1
+        if len(self.polygons) > self.max_polygons:
+            self.polygons.popitem(last=False)
+        return polygon
+
+    def sees(self, cell, points):
+        # (P,) bool mask of the points inside the polygon of the cell
+        return points_in_polygon(self.polygon(cell), points)